@@ -1,22 +1,87 @@
-import boto3
-from os import getenv
-
-import boto3
 from dotenv import load_dotenv
 import os
+import threading
 
 load_dotenv()
 
-def init_client(service='s3'):
-    client = boto3.client(
-        service,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),  
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
-        region_name=os.getenv("AWS_REGION_NAME")
-    )
- 
-    return client
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+# adaptive mode adds a client-side rate limiter on top of retries with
+# backoff; AWS_RETRY_MODE and AWS_MAX_ATTEMPTS still override both
+DEFAULT_RETRY_MODE = "adaptive"
+DEFAULT_MAX_ATTEMPTS = 10
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+_max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+
+
+def get_session():
+    # one botocore session shared by every client in the process
+    import boto3
+
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session(
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
+                region_name=os.getenv("AWS_REGION_NAME")
+            )
+        return _session
+
+
+def configure_client_pool(max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
+    # takes effect for clients created afterwards; cached clients are dropped
+    global _max_pool_connections
+    with _lock:
+        if max_pool_connections != _max_pool_connections:
+            _max_pool_connections = max_pool_connections
+            _clients.clear()
+
+
+def init_client(service='s3', region=None, endpoint_url=None):
+    # endpoint_url (or AWS_ENDPOINT_URL) points the client at an S3
+    # compatible stand-in such as moto_server or MinIO
+    from botocore.config import Config
+    from profiling import instrument_client
+
+    session = get_session()
+    region = region or session.region_name
+    endpoint_url = endpoint_url or os.getenv("AWS_ENDPOINT_URL")
+    with _lock:
+        key = (service, region, endpoint_url)
+        if key not in _clients:
+            _clients[key] = instrument_client(session.client(
+                service,
+                region_name=region,
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=_max_pool_connections,
+                    retries={
+                        'mode': os.getenv("AWS_RETRY_MODE", DEFAULT_RETRY_MODE),
+                        'total_max_attempts': int(os.getenv("AWS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+                    }
+                )
+            ))
+        return _clients[key]
+
+
+class LazyClient:
+    # stands in for a client and only creates it on first use
+
+    def __init__(self, service='s3', region=None, endpoint_url=None):
+        self.service = service
+        self.region = region
+        self.endpoint_url = endpoint_url
+
+    def __getattr__(self, name):
+        return getattr(init_client(self.service, self.region, self.endpoint_url), name)
+
+
+def lazy_client(service='s3', region=None, endpoint_url=None):
+    return LazyClient(service, region, endpoint_url)
 
 
 
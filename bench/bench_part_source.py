@@ -0,0 +1,142 @@
+"""Compare peak RSS and throughput of the plain-read and mmap part sources.
+
+    python bench/bench_part_source.py --size_mb 512 --part_size_mb 16 --concurrency 8
+
+Each mode runs in its own subprocess so ru_maxrss is not shared between them.
+Peak RSS includes mapped file pages, which the kernel can reclaim at any
+time; the anon column is the private heap the process actually allocates.
+The stub client drains every part body in 64 KiB chunks and hashes it, which
+is roughly what botocore and the HTTP layer do while sending a part.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from hashlib import md5
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from object.multipart import (MIB, FilePartSource, MmapPartSource, plan_parts,
+                              upload_parts_concurrently)
+
+
+SEND_CHUNK = 64 * 1024
+
+
+class DrainingClient:
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        digest = md5()
+        if hasattr(Body, 'read'):
+            while True:
+                chunk = Body.read(SEND_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        else:
+            view = memoryview(Body)
+            for start in range(0, len(view), SEND_CHUNK):
+                digest.update(view[start:start + SEND_CHUNK])
+        return {'ETag': f'"{digest.hexdigest()}"'}
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def anon_rss_mb():
+    # private (non file-backed) resident memory; Linux only
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class AnonSampler(threading.Thread):
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = anon_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(0.005):
+            self.peak = max(self.peak, anon_rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_mode(mode, file_path, part_size, concurrency):
+    source_class = MmapPartSource if mode == 'mmap' else FilePartSource
+    parts = plan_parts(os.path.getsize(file_path), part_size)
+    rss_before = peak_rss_mb()
+    anon_before = anon_rss_mb()
+    sampler = AnonSampler()
+    sampler.start()
+    source = source_class(file_path)
+    start = time.perf_counter()
+    try:
+        upload_parts_concurrently(DrainingClient(), source, 'bench', 'bench', 'bench',
+                                  parts, concurrency=concurrency)
+    finally:
+        source.close()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    return {
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'mb_per_s': round(os.path.getsize(file_path) / MIB / elapsed, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_rss_growth_mb': round(peak_rss_mb() - rss_before, 1),
+        'peak_anon_growth_mb': round(sampler.peak - anon_before, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multipart part sources.")
+    parser.add_argument("--size_mb", type=int, default=256)
+    parser.add_argument("--part_size_mb", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["file", "mmap"], default=None,
+                        help="internal: run a single mode and print JSON")
+    parser.add_argument("--file", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_mode(args.mode, args.file, args.part_size_mb * MIB, args.concurrency)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.bin')
+        with open(file_path, 'wb') as file:
+            for _ in range(args.size_mb):
+                file.write(os.urandom(MIB))
+
+        print(f"{args.size_mb} MiB file, {args.part_size_mb} MiB parts, concurrency {args.concurrency}")
+        print(f"{'mode':<6} {'MB/s':>8} {'peak RSS MB':>12} {'RSS growth MB':>14} {'anon growth MB':>15}")
+        for mode in ("file", "mmap"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--mode", mode, "--file", file_path,
+                 "--part_size_mb", str(args.part_size_mb), "--concurrency", str(args.concurrency)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['mode']:<6} {result['mb_per_s']:>8} {result['peak_rss_mb']:>12} "
+                  f"{result['peak_rss_growth_mb']:>14} {result['peak_anon_growth_mb']:>15}")
+
+
+if __name__ == "__main__":
+    main()
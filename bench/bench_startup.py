@@ -0,0 +1,107 @@
+"""Measure CLI startup time: cold import of main, --help, and -lb.
+
+    python bench/bench_startup.py --runs 15 --save bench/startup_baseline.json
+    python bench/bench_startup.py --runs 15 --compare bench/startup_baseline.json
+
+-lb runs against a local stub that answers ListBuckets, reached through
+AWS_ENDPOINT_URL, so no AWS account or network is needed. --compare exits
+with status 1 when any median is slower than the baseline by more than
+--tolerance.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIST_BUCKETS_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<ListAllMyBucketsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <Owner><ID>bench</ID><DisplayName>bench</DisplayName></Owner>
+  <Buckets><Bucket><Name>bench-bucket</Name><CreationDate>2024-01-01T00:00:00.000Z</CreationDate></Bucket></Buckets>
+</ListAllMyBucketsResult>"""
+
+
+class StubS3Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(LIST_BUCKETS_XML)))
+        self.end_headers()
+        self.wfile.write(LIST_BUCKETS_XML)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def time_command(command, env, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 1)
+
+
+def run_benchmarks(runs):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubS3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ,
+               AWS_ENDPOINT_URL=f"http://127.0.0.1:{server.server_port}",
+               AWS_ACCESS_KEY_ID="bench",
+               AWS_SECRET_ACCESS_KEY="bench",
+               AWS_REGION_NAME="us-east-1",
+               PYTHONDONTWRITEBYTECODE="1")
+    try:
+        return {
+            'python_baseline_ms': time_command([sys.executable, "-c", "pass"], env, runs),
+            'import_main_ms': time_command([sys.executable, "-c", "import main"], env, runs),
+            'help_ms': time_command([sys.executable, "main.py", "--help"], env, runs),
+            'list_buckets_ms': time_command([sys.executable, "main.py", "-lb"], env, runs),
+        }
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--save", type=str, default=None, help="write results as JSON baseline")
+    parser.add_argument("--compare", type=str, default=None, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.runs)
+    for name, value in results.items():
+        print(f"{name:<20} {value:>8} ms")
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = [
+            name for name, value in results.items()
+            if name != 'python_baseline_ms' and name in baseline
+            and value > baseline[name] * (1 + args.tolerance)
+        ]
+        for name in regressions:
+            print(f"REGRESSION {name}: {results[name]} ms vs baseline {baseline[name]} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Benchmark uploads, listing and version cleanup against a local S3 stand-in.
+
+    moto_server -p 5000 &
+    python bench/bench_transfers.py --endpoint http://127.0.0.1:5000 --save bench/transfers_baseline.json
+    python bench/bench_transfers.py --endpoint http://127.0.0.1:5000 --compare bench/transfers_baseline.json
+
+--endpoint also works with MinIO (credentials from AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY). Without it a moto server is started on a free port
+when moto[server] is installed, otherwise moto's in-process mock is used,
+which skips HTTP entirely and only suits comparing runs made the same way.
+
+Every scenario runs against a fresh bucket; setup is not timed. Requests
+and their latencies are counted with botocore events on the client, so the
+numbers include the calls s3transfer makes on its own. --compare exits with
+status 1 when a scenario's median time is slower than the baseline by more
+than --tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import init_client, configure_client_pool
+from object.multipart import MIB
+
+
+KIB = 1024
+
+
+class RequestRecorder:
+    # wall time of every S3 API call made through the client
+
+    def __init__(self, aws_s3_client):
+        self.latencies = []
+        events = aws_s3_client.meta.events
+        events.register('before-call.s3', self.before_call)
+        events.register('after-call.s3', self.after_call)
+
+    def before_call(self, context, **kwargs):
+        context['bench_start'] = time.perf_counter()
+
+    def after_call(self, context, **kwargs):
+        if 'bench_start' in context:
+            self.latencies.append(time.perf_counter() - context['bench_start'])
+
+    def reset(self):
+        self.latencies = []
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def write_random_file(file_path, size):
+    with open(file_path, 'wb') as file:
+        remaining = size
+        while remaining:
+            chunk = min(remaining, 8 * MIB)
+            file.write(os.urandom(chunk))
+            remaining -= chunk
+
+
+def put_objects(aws_s3_client, bucket_name, keys, concurrency, body=b'x' * 128):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda key: aws_s3_client.put_object(Bucket=bucket_name, Key=key, Body=body),
+                          keys))
+
+
+def empty_and_delete_bucket(aws_s3_client, bucket_name):
+    from object.crud import delete_object_batches
+
+    # list everything before deleting: deleting under the paginator moves
+    # the listing, and the next page can come back empty
+    objects = []
+    paginator = aws_s3_client.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket_name):
+        objects += [{'Key': entry['Key'], 'VersionId': entry['VersionId']}
+                    for entry in page.get('Versions', []) + page.get('DeleteMarkers', [])]
+    if objects:
+        _, errors = delete_object_batches(aws_s3_client, bucket_name, objects)
+        if errors:
+            key, version_id, error = errors[0]
+            raise RuntimeError(f"could not empty {bucket_name}: {len(errors)} versions left, "
+                               f"first {key} ({version_id}): {error}")
+    aws_s3_client.delete_bucket(Bucket=bucket_name)
+
+
+def upload_file_scenario(size):
+    def setup(aws_s3_client, bucket_name, work_dir, args):
+        file_path = os.path.join(work_dir, f'file_{size}.bin')
+        if not os.path.exists(file_path):
+            write_random_file(file_path, size)
+        return file_path
+
+    def run(aws_s3_client, bucket_name, file_path, args):
+        from object.crud import upload_file
+        if not upload_file(aws_s3_client, file_path, bucket_name):
+            raise RuntimeError("upload_file failed")
+        return size
+
+    return f"upload_file/{size // KIB}KiB", setup, run
+
+
+def upload_large_file_scenario(size):
+    def setup(aws_s3_client, bucket_name, work_dir, args):
+        file_path = os.path.join(work_dir, f'large_{size}.bin')
+        if not os.path.exists(file_path):
+            write_random_file(file_path, size)
+        return file_path
+
+    def run(aws_s3_client, bucket_name, file_path, args):
+        from object.crud import upload_large_file
+        if not upload_large_file(aws_s3_client, file_path, bucket_name,
+                                 part_size=args.part_size_mb * MIB, concurrency=args.concurrency):
+            raise RuntimeError("upload_large_file failed")
+        return size
+
+    return f"upload_large_file/{size // MIB}MiB", setup, run
+
+
+def upload_folder_scenario(count, file_size):
+    def setup(aws_s3_client, bucket_name, work_dir, args):
+        folder_path = os.path.join(work_dir, f'folder_{count}x{file_size}')
+        if not os.path.isdir(folder_path):
+            for index in range(count):
+                sub_folder = os.path.join(folder_path, f'd{index % 16:02d}')
+                os.makedirs(sub_folder, exist_ok=True)
+                write_random_file(os.path.join(sub_folder, f'f{index:06d}.txt'), file_size)
+        return folder_path
+
+    def run(aws_s3_client, bucket_name, folder_path, args):
+        from object.crud import upload_folder_to_s3
+        if not upload_folder_to_s3(aws_s3_client, folder_path, bucket_name, concurrency=args.concurrency):
+            raise RuntimeError("upload_folder_to_s3 failed")
+        return count * file_size
+
+    return f"upload_folder/{count}x{file_size // KIB}KiB", setup, run
+
+
+def list_scenario(count, parallel):
+    def setup(aws_s3_client, bucket_name, work_dir, args):
+        keys = [f'd{index % 16:02d}/obj{index:06d}' for index in range(count)]
+        put_objects(aws_s3_client, bucket_name, keys, args.concurrency)
+
+    def run(aws_s3_client, bucket_name, state, args):
+        from object.crud import get_objects
+        listed = get_objects(aws_s3_client, bucket_name, parallel=parallel, concurrency=args.concurrency)
+        if listed != count:
+            raise RuntimeError(f"listed {listed} of {count} objects")
+        return 0
+
+    name = 'list_parallel' if parallel else 'list'
+    return f"{name}/{count}", setup, run
+
+
+def version_cleanup_scenario(count, versions_per_key=5):
+    def setup(aws_s3_client, bucket_name, work_dir, args):
+        aws_s3_client.put_bucket_versioning(Bucket=bucket_name,
+                                            VersioningConfiguration={'Status': 'Enabled'})
+        keys = [f'd{index % 16:02d}/obj{index:06d}' for index in range(count // versions_per_key)]
+        for _ in range(versions_per_key):
+            put_objects(aws_s3_client, bucket_name, keys, args.concurrency)
+        # every version is now older than a zero-month cutoff
+        time.sleep(0.01)
+
+    def run(aws_s3_client, bucket_name, state, args):
+        from object.crud import check_and_delete_old_versions
+        check_and_delete_old_versions(aws_s3_client, bucket_name, months=0, concurrency=args.concurrency)
+        return 0
+
+    return f"version_cleanup/{count}", setup, run
+
+
+def build_scenarios(args):
+    scenarios = [upload_file_scenario(size_kb * KIB) for size_kb in args.file_sizes_kb]
+    scenarios += [upload_large_file_scenario(size_mb * MIB) for size_mb in args.large_sizes_mb]
+    scenarios += [upload_folder_scenario(count, args.folder_file_kb * KIB) for count in args.folder_counts]
+    for count in args.list_counts:
+        scenarios += [list_scenario(count, False), list_scenario(count, True)]
+    scenarios += [version_cleanup_scenario(count) for count in args.version_counts]
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if args.only in scenario[0]]
+    return scenarios
+
+
+def run_scenario(aws_s3_client, recorder, scenario, work_dir, args):
+    name, setup, run = scenario
+    measurements = []
+    for _ in range(args.runs):
+        bucket_name = f"bench-{uuid.uuid4().hex[:16]}"
+        aws_s3_client.create_bucket(Bucket=bucket_name)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                state = setup(aws_s3_client, bucket_name, work_dir, args)
+                recorder.reset()
+                start = time.perf_counter()
+                moved = run(aws_s3_client, bucket_name, state, args)
+                elapsed = time.perf_counter() - start
+            latencies = recorder.latencies
+            measurements.append({
+                'seconds': round(elapsed, 4),
+                'mb_per_s': round(moved / MIB / elapsed, 2),
+                'requests': len(latencies),
+                'req_per_s': round(len(latencies) / elapsed, 1),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            })
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                empty_and_delete_bucket(aws_s3_client, bucket_name)
+    # report the run with the median time
+    median_seconds = statistics.median_low(m['seconds'] for m in measurements)
+    return next(m for m in measurements if m['seconds'] == median_seconds)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@contextlib.contextmanager
+def s3_endpoint(endpoint_url):
+    # yields (endpoint_url or None, description)
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ.setdefault('AWS_REGION_NAME', 'us-east-1')
+    if endpoint_url:
+        yield endpoint_url, endpoint_url
+        return
+
+    try:
+        with warnings.catch_warnings():
+            # moto warns on import when the server extras are missing
+            warnings.simplefilter('ignore')
+            from moto.server import ThreadedMotoServer
+    except ImportError:
+        ThreadedMotoServer = None
+
+    if ThreadedMotoServer is not None:
+        port = free_port()
+        server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+        server.start()
+        try:
+            yield f"http://127.0.0.1:{port}", f"moto server on port {port}"
+        finally:
+            server.stop()
+        return
+
+    from moto import mock_aws
+    with mock_aws():
+        yield None, "moto in-process mock (no HTTP)"
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark S3 transfers against a local stand-in.")
+    parser.add_argument("--endpoint", type=str, default=None,
+                        help="S3 compatible endpoint, e.g. a moto_server or MinIO URL")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--part_size_mb", type=int, default=8)
+    parser.add_argument("--file_sizes_kb", type=int_list, default=[64, 1024, 8192])
+    parser.add_argument("--large_sizes_mb", type=int_list, default=[32, 128])
+    parser.add_argument("--folder_counts", type=int_list, default=[100, 1000])
+    parser.add_argument("--folder_file_kb", type=int, default=4)
+    parser.add_argument("--list_counts", type=int_list, default=[1000, 5000])
+    parser.add_argument("--version_counts", type=int_list, default=[1000])
+    parser.add_argument("--only", type=str, default=None, help="run scenarios whose name contains this")
+    parser.add_argument("--save", type=str, default=None, help="write results as JSON baseline")
+    parser.add_argument("--compare", type=str, default=None, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    configure_client_pool(max(10, args.concurrency * 2))
+    results = {}
+    with s3_endpoint(args.endpoint) as (endpoint_url, description), \
+            tempfile.TemporaryDirectory() as work_dir:
+        print(f"Target: {description}, concurrency {args.concurrency}, median of {args.runs} runs")
+        aws_s3_client = init_client('s3', endpoint_url=endpoint_url)
+        recorder = RequestRecorder(aws_s3_client)
+
+        print(f"{'scenario':<32} {'seconds':>9} {'MB/s':>9} {'requests':>9} {'req/s':>9} "
+              f"{'p50 ms':>8} {'p99 ms':>8}")
+        for scenario in build_scenarios(args):
+            result = run_scenario(aws_s3_client, recorder, scenario, work_dir, args)
+            results[scenario[0]] = result
+            print(f"{scenario[0]:<32} {result['seconds']:>9} {result['mb_per_s']:>9} {result['requests']:>9} "
+                  f"{result['req_per_s']:>9} {result['p50_ms']:>8} {result['p99_ms']:>8}")
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = [
+            name for name, result in results.items()
+            if name in baseline and result['seconds'] > baseline[name]['seconds'] * (1 + args.tolerance)
+        ]
+        for name in regressions:
+            print(f"REGRESSION {name}: {results[name]['seconds']} s vs baseline {baseline[name]['seconds']} s")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,13 @@
 "main.py"
 
 import logging
-from botocore.exceptions import ClientError
-from auth import init_client
-from bucket.crud import *
-from bucket.policy import *
-from object.crud import *
-from ec2.operations import *
-from bucket.encryption import set_bucket_encryption, read_bucket_encryption
-from bucket.website import *
-from utils import fetch_quote
+from auth import lazy_client, configure_client_pool, DEFAULT_MAX_POOL_CONNECTIONS
 import argparse
 import tempfile
 import os
 
-from rds.operations import *
-from dynamodb.operations import *
-
+# action modules are imported inside the branches that use them, so
+# --help or a single -lb does not pay for boto3 or the EC2/RDS code
 
 parser = argparse.ArgumentParser(
   description="CLI program that helps with S3 buckets.",
@@ -44,6 +35,15 @@ parser = argparse.ArgumentParser(
         -bn new-bucket-btu-1 -amp
     long:
         --bn new-bucket-btu-1 --assign_missing_policy
+
+    How to run many operations in one process:
+        python main.py -bn new-bucket-btu-1 --manifest ops.jsonl -cc 16
+    ops.jsonl lines:
+        {"op": "upload", "file": "report.csv", "key": "reports/report.csv"}
+        {"op": "delete", "key": "old.txt"}
+        {"op": "copy", "key": "copy.txt", "source_key": "a.txt", "source_bucket": "other-bucket"}
+        {"op": "restore", "key": "a.txt", "version_id": "..."}
+        {"op": "acl", "key": "a.txt", "acl": "public-read"}
     ''',
   prog='main.py',
   epilog='DEMO APP FOR BTU_AWS')
@@ -153,6 +153,33 @@ parser.add_argument("-lo",
                     const="True",
                     default="False")
 
+parser.add_argument("--prefix",
+                    type=str,
+                    help="Only list objects under this key prefix",
+                    default="")
+
+parser.add_argument("-pl",
+                    "--parallel_list",
+                    help="List objects or scan old versions for each top-level prefix concurrently",
+                    choices=["False", "True"],
+                    type=str,
+                    nargs="?",
+                    const="True",
+                    default="False")
+
+parser.add_argument("--index",
+                    type=str,
+                    help="SQLite file with a local index of bucket keys and versions; -lo, -cfv and -dov read from it",
+                    default=None)
+
+parser.add_argument("--refresh_index",
+                    help="Re-list the bucket (or only --prefix) into --index before running other actions",
+                    choices=["False", "True"],
+                    type=str,
+                    nargs="?",
+                    const="True",
+                    default="False")
+
 parser.add_argument("-ben",
                     "--bucket_encryption",
                     type=str,
@@ -181,6 +208,62 @@ parser.add_argument("-lf",
                     help="Path to large file for multipart upload",
                     default=None)
 
+parser.add_argument("-dlf",
+                    "--download_large_file",
+                    type=str,
+                    help="Local path to download -key into with parallel ranged GETs",
+                    default=None)
+
+parser.add_argument("-ps",
+                    "--part_size",
+                    type=int,
+                    help="Part size in MiB for multipart upload and download (minimum 5 for uploads, "
+                         "default: picked from the file size for -lf, 16 for -dlf)",
+                    default=None)
+
+parser.add_argument("-cc",
+                    "--concurrency",
+                    type=int,
+                    help="Number of parallel uploads (multipart parts or website files)",
+                    default=8)
+
+parser.add_argument("--fixed_concurrency",
+                    help="With -lf, keep --concurrency parts in flight instead of tuning it from throughput",
+                    choices=["False", "True"],
+                    type=str,
+                    nargs="?",
+                    const="True",
+                    default="False")
+
+parser.add_argument("-pr",
+                    "--part_retries",
+                    type=int,
+                    help="Retries per part before the multipart upload is aborted",
+                    default=3)
+
+parser.add_argument("--max_pool_connections",
+                    type=int,
+                    help="HTTP connections kept per client (default: twice --concurrency, at least 10)",
+                    default=None)
+
+parser.add_argument("-rs",
+                    "--resume",
+                    help="Keep a local journal for multipart upload and resume it on rerun",
+                    choices=["False", "True"],
+                    type=str,
+                    nargs="?",
+                    const="True",
+                    default="False")
+
+parser.add_argument("-su",
+                    "--skip_unchanged",
+                    help="Skip -sf, -lf and -uft uploads when the bucket already holds an identical object (compared by ETag)",
+                    choices=["False", "True"],
+                    type=str,
+                    nargs="?",
+                    const="True",
+                    default="False")
+
 parser.add_argument("-slp",
                     "--set_lifecycle_policy",
                     help="Set lifecycle policy to delete objects after 120 days",
@@ -259,7 +342,7 @@ parser.add_argument("-uft",
 parser.add_argument("-fp",
                     "--file_path",
                     type=str,
-                    help="Path to file for type-based upload",
+                    help="Path to file (or directory, for a batch upload) for type-based upload",
                     default=None)
 
 parser.add_argument("-dov",
@@ -278,6 +361,46 @@ parser.add_argument("-m",
                     default=6)
 
 
+parser.add_argument("--dry_run",
+                    help="With -dov, only report how many versions and bytes would be deleted per prefix",
+                    choices=["False", "True"],
+                    type=str,
+                    nargs="?",
+                    const="True",
+                    default="False")
+
+parser.add_argument("--checkpoint",
+                    type=str,
+                    help="With -dov, checkpoint file used to resume an interrupted version scan",
+                    default=None)
+
+
+parser.add_argument("--profile",
+                    help="Time every AWS API call and report count, latency, retries and bytes "
+                         "per operation at exit",
+                    choices=["table", "json", "prometheus"],
+                    type=str,
+                    nargs="?",
+                    const="table",
+                    default=None)
+
+parser.add_argument("--profile_output",
+                    type=str,
+                    help="With --profile json/prometheus, file to write the report to instead of stdout",
+                    default=None)
+
+parser.add_argument("--manifest",
+                    type=str,
+                    help="Run the operations listed in a JSONL or CSV file (upload, delete, copy, restore, acl) "
+                         "with --concurrency workers; -bn is the default bucket",
+                    default=None)
+
+parser.add_argument("--results",
+                    type=str,
+                    help="With --manifest, file for the per-line results (default: <manifest>.results.jsonl)",
+                    default=None)
+
+
 parser.add_argument("host",
                    help="Host a static website on S3",
                    nargs="?") 
@@ -286,6 +409,36 @@ parser.add_argument("--source",
                    type=str,
                    help="Source for website files (GitHub URL or local folder)",
                    default=None)
+parser.add_argument("--sync",
+                   help="Only upload new or changed website files",
+                   choices=["False", "True"],
+                   type=str,
+                   nargs="?",
+                   const="True",
+                   default="False")
+
+parser.add_argument("--delete_removed",
+                   help="With --sync, delete bucket objects that no longer exist locally",
+                   choices=["False", "True"],
+                   type=str,
+                   nargs="?",
+                   const="True",
+                   default="False")
+
+parser.add_argument("--publish",
+                   help="Publish website files gzip/brotli compressed with Cache-Control headers",
+                   choices=["False", "True"],
+                   type=str,
+                   nargs="?",
+                   const="True",
+                   default="False")
+
+parser.add_argument("--compression",
+                   help="Content-Encoding used by --publish",
+                   choices=["gzip", "br", "none"],
+                   type=str,
+                   default="gzip")
+
 parser.add_argument(
     "--inspire",
     type=str,
@@ -346,7 +499,7 @@ parser.add_argument("--list_rds",
 
 
 parser.add_argument("--increase_storage", 
-                   help="Increase RDS storage by 25%", 
+                   help="Increase RDS storage by 25%%", 
                    choices=["False", "True"], 
                    type=str, 
                    nargs="?", 
@@ -375,11 +528,20 @@ parser.add_argument("--snapshot_id",
                    default=None)
 
 def host_static_website(s3_client, args):
+    from bucket.crud import bucket_exists, create_bucket
+    from bucket.website import set_website_policy, configure_website, get_website_url
+    from object.crud import clone_github_repo, upload_folder_to_s3, upload_github_repo_to_s3
+    from object.sync import sync_folder_to_s3
+    from object.publish import publish_folder_to_s3
+
     if not args.bucket_name:
         parser.error("Please provide a bucket name with --bucket_name")
     
     if not args.source:
         parser.error("Please provide a source with --source")
+
+    if args.publish == "True" and args.sync == "True":
+        parser.error("--publish uploads compressed copies and cannot be combined with --sync")
     
     region = args.region if hasattr(args, 'region') and args.region else "us-east-1"
 
@@ -389,24 +551,47 @@ def host_static_website(s3_client, args):
             print("Failed to create bucket")
             return False
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        source_dir = temp_dir
-
-        if args.source.startswith('http') and 'github.com' in args.source:
-            print(f"Cloning GitHub repository {args.source}...")
-            if not clone_github_repo(args.source, temp_dir):
-                print("Failed to clone repository")
-                return False
-        elif os.path.isdir(args.source):
-            print(f"Using local directory {args.source}")
-            source_dir = args.source
-        else:
-            print(f"Invalid source: {args.source}")
-            return False
-        print(f"Uploading files to bucket {args.bucket_name}...")
-        if not upload_folder_to_s3(s3_client, source_dir, args.bucket_name):
+    is_github = args.source.startswith('http') and 'github.com' in args.source
+    if is_github and args.sync != "True" and args.publish != "True":
+        # stream the archive members straight into the bucket; sync and
+        # publish below still need a local tree
+        print(f"Uploading GitHub repository {args.source} to bucket {args.bucket_name}...")
+        if not upload_github_repo_to_s3(s3_client, args.source, args.bucket_name,
+                                        concurrency=args.concurrency):
             print("Failed to upload files")
             return False
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source_dir = temp_dir
+
+            if is_github:
+                print(f"Cloning GitHub repository {args.source}...")
+                if not clone_github_repo(args.source, temp_dir):
+                    print("Failed to clone repository")
+                    return False
+            elif os.path.isdir(args.source):
+                print(f"Using local directory {args.source}")
+                source_dir = args.source
+            else:
+                print(f"Invalid source: {args.source}")
+                return False
+            if args.publish == "True":
+                print(f"Publishing files to bucket {args.bucket_name}...")
+                uploaded = publish_folder_to_s3(s3_client, source_dir, args.bucket_name,
+                                                concurrency=args.concurrency,
+                                                encoding=None if args.compression == "none" else args.compression)
+            elif args.sync == "True":
+                print(f"Syncing files to bucket {args.bucket_name}...")
+                uploaded = sync_folder_to_s3(s3_client, source_dir, args.bucket_name,
+                                             concurrency=args.concurrency,
+                                             delete=args.delete_removed == "True")
+            else:
+                print(f"Uploading files to bucket {args.bucket_name}...")
+                uploaded = upload_folder_to_s3(s3_client, source_dir, args.bucket_name,
+                                               concurrency=args.concurrency)
+            if not uploaded:
+                print("Failed to upload files")
+                return False
 
     print("Configuring website hosting...")
     if not configure_website(s3_client, args.bucket_name):
@@ -424,16 +609,27 @@ def host_static_website(s3_client, args):
     return website_url
 
 def main():
-    s3_client = init_client(service='s3')
-    ec2_client = init_client(service='ec2')
-    rds_client = init_client(service='rds')
-    dynamodb_client = init_client(service='dynamodb')
     args = parser.parse_args()
+    if args.profile:
+        import atexit
+        from profiling import enable_profiling
+        # atexit also reports runs that end in an exception
+        atexit.register(enable_profiling().report, args.profile, args.profile_output)
+    max_pool_connections = max(DEFAULT_MAX_POOL_CONNECTIONS, args.concurrency * 2)
+    if args.large_file and args.fixed_concurrency != "True":
+        from object.autotune import MAX_AUTO_CONCURRENCY
+        max_pool_connections = max(max_pool_connections, MAX_AUTO_CONCURRENCY)
+    configure_client_pool(args.max_pool_connections or max_pool_connections)
+    s3_client = lazy_client(service='s3')
+    ec2_client = lazy_client(service='ec2')
+    rds_client = lazy_client(service='rds')
+    dynamodb_client = lazy_client(service='dynamodb')
 
     if args.create_rds == "True":
         if not args.db_instance_id or not args.security_group_id:
             parser.error("Please provide both --db_instance_id and --security_group_id for RDS creation")
         region = args.region if args.region else "us-east-1"
+        from rds.operations import create_rds_instance
         result = create_rds_instance(rds_client, args.db_instance_id, args.security_group_id, region)
         if result:
             print("Connect using these details in your database tool (DBeaver, DataGrip, etc.)")
@@ -441,24 +637,30 @@ def main():
     if args.delete_rds == "True":
         if not args.db_instance_id:
             parser.error("Please provide --db_instance_id for RDS deletion")
+        from rds.operations import delete_rds_instance
         delete_rds_instance(rds_client, args.db_instance_id)
 
     if args.list_rds == "True":
+        from rds.operations import list_rds_instances
         list_rds_instances(rds_client)
 
     if args.increase_storage == "True":
         if not args.db_instance_id:
             parser.error("Please provide --db_instance_id for storage increase")
+        from rds.operations import increase_rds_storage
         increase_rds_storage(rds_client, args.db_instance_id)
 
     if args.list_dynamodb == "True":
+        from dynamodb.operations import list_dynamodb_tables
         list_dynamodb_tables(dynamodb_client)
 
     if args.create_snapshot == "True":
         if not args.db_instance_id or not args.snapshot_id:
             parser.error("Please provide both --db_instance_id and --snapshot_id for snapshot creation")
+        from rds.operations import create_rds_snapshot
         create_rds_snapshot(rds_client, args.db_instance_id, args.snapshot_id)
     if args.inspire:
+        from utils import fetch_quote
         author_name = args.inspire if isinstance(args.inspire, str) else None
         fetched_quote = fetch_quote(author=author_name)
         if fetched_quote:
@@ -468,11 +670,22 @@ def main():
             print("-" * 30)
             if args.save_quote:
                 if args.bucket_name:
+                    from object.crud import save_quote_to_s3
                     save_quote_to_s3(s3_client, args.bucket_name, fetched_quote)
                 else:
                     print("Error: --bucket_name is required when using -save/--save_quote.")
 
+    if args.manifest:
+        from object.batch import run_manifest
+        run_manifest(s3_client, args.manifest, args.results, concurrency=args.concurrency,
+                     default_bucket=args.bucket_name)
+
     if args.bucket_name:
+        if args.index and args.refresh_index == "True":
+            from object.crud import refresh_object_index
+            refresh_object_index(s3_client, args.bucket_name, args.index,
+                                 prefixes=[args.prefix] if args.prefix else None)
+
         if args.host and args.source:
             host_static_website(s3_client, args)
 
@@ -482,39 +695,65 @@ def main():
             print(f"Checking for old versions in bucket {args.bucket_name}...")
             file_key = args.file_key if hasattr(args, 'file_key') else None
             if file_key:
+                if args.checkpoint:
+                    parser.error("--checkpoint resumes a whole bucket scan and cannot be combined with -key")
+                if args.index:
+                    parser.error("-dov reads the whole bucket from --index and cannot be combined with -key")
                 print(f"Looking at specific file: {file_key}")
-            deleted_count = check_and_delete_old_versions(s3_client, args.bucket_name, file_key, args.months)
-            if deleted_count > 0:
+            from object.crud import check_and_delete_old_versions
+            deleted_count = check_and_delete_old_versions(s3_client, args.bucket_name, file_key, args.months,
+                                                          concurrency=args.concurrency,
+                                                          sharded=args.parallel_list == "True",
+                                                          checkpoint_path=args.checkpoint,
+                                                          dry_run=args.dry_run == "True",
+                                                          index_path=args.index)
+            if args.dry_run == "True":
+                print("Dry run finished, nothing was deleted")
+            elif deleted_count > 0:
                 print(f"Successfully deleted {deleted_count} old versions")
             else:
                 print("No old versions found to delete")
 
         if args.upload_file_by_type == "True" and args.file_path:
             print(f"Uploading {args.file_path} to bucket {args.bucket_name} based on file type...")
-            from object.crud import upload_file_by_type
-            if upload_file_by_type(s3_client, args.file_path, args.bucket_name):
+            from object.crud import upload_file_by_type, upload_folder_by_type
+            if os.path.isdir(args.file_path):
+                if upload_folder_by_type(s3_client, args.file_path, args.bucket_name,
+                                         concurrency=args.concurrency):
+                    print(f"Successfully uploaded {args.file_path} to {args.bucket_name} in type folders")
+                else:
+                    print(f"Failed to upload some files from {args.file_path}")
+            elif upload_file_by_type(s3_client, args.file_path, args.bucket_name,
+                                   skip_unchanged=args.skip_unchanged == "True"):
                 print(f"Successfully uploaded {args.file_path} to {args.bucket_name} in appropriate folder")
             else:
                 print(f"Failed to upload {args.file_path}")
 
         if args.check_versioning == "True":
+            from bucket.crud import check_bucket_versioning
             check_bucket_versioning(s3_client, args.bucket_name)
 
         if args.check_file_versions == "True" and args.file_key:
-            get_file_versions(s3_client, args.bucket_name, args.file_key)
+            from object.crud import get_file_versions
+            get_file_versions(s3_client, args.bucket_name, args.file_key, index_path=args.index)
 
         if args.upload_previous_version == "True" and args.file_key:
-            upload_previous_version(s3_client, args.bucket_name, args.file_key)
+            from object.crud import upload_previous_version
+            upload_previous_version(s3_client, args.bucket_name, args.file_key,
+                                    concurrency=args.concurrency)
 
         if args.delete_file == "True" and args.bucket_name and args.file_key:
             print(f"Attempting to delete file {args.file_key} from bucket {args.bucket_name}...")
+            from object.crud import delete_object_from_bucket
             delete_object_from_bucket(s3_client, args.bucket_name, args.file_key)
 
         if args.set_lifecycle_policy == "True":
+            from bucket.policy import set_lifecycle_policy
             if set_lifecycle_policy(s3_client, args.bucket_name, args.days_until_deletion):
                 print(f"Successfully set lifecycle policy to delete objects after {args.days_until_deletion} days")
 
         if args.get_lifecycle_policy == "True":
+            from bucket.policy import get_lifecycle_policy
             lifecycle_policy = get_lifecycle_policy(s3_client, args.bucket_name)
             if lifecycle_policy:
                 print("Current lifecycle policy:")
@@ -524,16 +763,38 @@ def main():
             if not args.bucket_name:
                 parser.error("Please provide a bucket name with --bucket_name")
             print(f"Uploading {args.small_file} to bucket {args.bucket_name}...")
-            if upload_file(s3_client, args.small_file, args.bucket_name):
+            from object.crud import upload_file
+            if upload_file(s3_client, args.small_file, args.bucket_name,
+                           skip_unchanged=args.skip_unchanged == "True"):
                 print(f"Successfully uploaded {args.small_file} to {args.bucket_name}")
             else:
                 print(f"Failed to upload {args.small_file}")
 
         if args.large_file:
-            if upload_large_file(s3_client, args.large_file, args.bucket_name):
+            from object.crud import upload_large_file
+            if upload_large_file(s3_client, args.large_file, args.bucket_name,
+                                 part_size=args.part_size * 1024 * 1024 if args.part_size else None,
+                                 concurrency=args.concurrency,
+                                 max_retries=args.part_retries,
+                                 resume=args.resume == "True",
+                                 skip_unchanged=args.skip_unchanged == "True",
+                                 autotune=args.fixed_concurrency != "True"):
                 print(f"Successfully uploaded large file {args.large_file} to {args.bucket_name}")
 
+        if args.download_large_file:
+            if not args.file_key:
+                parser.error("Please provide the object to download with -key")
+            if args.part_size is not None and args.part_size < 1:
+                parser.error("--part_size must be at least 1 MiB for -dlf")
+            from object.crud import download_large_file
+            if download_large_file(s3_client, args.bucket_name, args.file_key, args.download_large_file,
+                                   part_size=args.part_size * 1024 * 1024 if args.part_size else None,
+                                   concurrency=args.concurrency,
+                                   max_retries=args.part_retries):
+                print(f"Successfully downloaded {args.file_key} to {args.download_large_file}")
+
         if args.create_bucket == "True":
+            from bucket.crud import bucket_exists, create_bucket
             if not args.region:
                 parser.error("Please provide region for bucket --region REGION_NAME")
             if args.bucket_check == "True" and bucket_exists(s3_client, args.bucket_name):
@@ -541,40 +802,54 @@ def main():
             if create_bucket(s3_client, args.bucket_name, args.region):
                 print("Bucket successfully created")
 
-        if args.delete_bucket == "True" and delete_bucket(s3_client, args.bucket_name):
-            print("Bucket successfully deleted")
+        if args.delete_bucket == "True":
+            from bucket.crud import delete_bucket
+            if delete_bucket(s3_client, args.bucket_name):
+                print("Bucket successfully deleted")
 
         if args.bucket_exists == "True":
+            from bucket.crud import bucket_exists
             print(f"Bucket exists: {bucket_exists(s3_client, args.bucket_name)}")
 
         if args.read_policy == "True":
+            from bucket.policy import read_bucket_policy
             print(read_bucket_policy(s3_client, args.bucket_name))
 
         if args.assign_read_policy == "True":
+            from bucket.policy import assign_policy
             assign_policy(s3_client, "public_read_policy", args.bucket_name)
 
         if args.assign_missing_policy == "True":
+            from bucket.policy import assign_policy
             assign_policy(s3_client, "multiple_policy", args.bucket_name)
 
         if args.object_link:
             if args.download_upload == "True":
+                from object.crud import download_file_and_upload_to_s3
                 print(download_file_and_upload_to_s3(s3_client, args.bucket_name, args.object_link))
 
         if args.bucket_encryption == "True":
+            from bucket.encryption import set_bucket_encryption
             if set_bucket_encryption(s3_client, args.bucket_name):
                 print("Encryption set")
 
         if args.read_bucket_encryption == "True":
+            from bucket.encryption import read_bucket_encryption
             print(read_bucket_encryption(s3_client, args.bucket_name))
 
         if args.list_objects == "True":
-            get_objects(s3_client, args.bucket_name)
+            from object.crud import get_objects
+            get_objects(s3_client, args.bucket_name, prefix=args.prefix,
+                        parallel=args.parallel_list == "True",
+                        concurrency=args.concurrency,
+                        index_path=args.index)
 
     if args.launch_ec2 == "True":
         if not args.vpc_id or not args.subnet_id:
             parser.error("Please provide both --vpc_id and --subnet_id for EC2 instance creation")
         region = args.region if args.region else "us-east-1"
         print(f"Launching EC2 instance in VPC {args.vpc_id}, Subnet {args.subnet_id}...")
+        from ec2.operations import launch_ec2_instance
         result = launch_ec2_instance(ec2_client, args.vpc_id, args.subnet_id, region)
         if result:
             print(f"EC2 instance launched successfully: {result['instance_id']}")
@@ -586,6 +861,7 @@ def main():
             print("Failed to launch EC2 instance")
 
     if args.list_buckets:
+        from bucket.crud import list_buckets
         buckets = list_buckets(s3_client)
         if buckets:
             for bucket in buckets['Buckets']:
@@ -593,6 +869,7 @@ def main():
 
 
 if __name__ == "__main__":
+  from botocore.exceptions import ClientError
   try:
     main()
   except ClientError as e:
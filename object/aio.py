@@ -0,0 +1,136 @@
+#aio
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from object.crud import iter_object_pages, delete_object_batches
+from object.multipart import (DEFAULT_MAX_RETRIES, MIN_PART_SIZE, MAX_PARTS,
+                              plan_parts, open_part_source, upload_part_with_retry)
+from object.autotune import auto_part_size
+
+
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+class AsyncObjectClient:
+    # asyncio facade over a boto3 S3 client. Every call runs on one shared
+    # thread pool and waits on a semaphore, so an event loop can start
+    # thousands of operations while at most max_concurrency are in flight.
+    # Build the client with max_pool_connections >= max_concurrency
+    # (auth.configure_client_pool) or requests queue for a connection.
+
+    def __init__(self, aws_s3_client, max_concurrency=DEFAULT_MAX_CONCURRENCY, executor=None):
+        self._client = aws_s3_client
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def _run(self, func, *args, **kwargs):
+        async with self._semaphore:
+            return await self._call(func, *args, **kwargs)
+
+    async def _call(self, func, *args, **kwargs):
+        # runs func on the pool; callers hold the semaphore
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def put_object(self, bucket_name, key, body, **kwargs):
+        return await self._run(self._client.put_object, Bucket=bucket_name, Key=key, Body=body, **kwargs)
+
+    async def upload_file(self, file_path, bucket_name, key, **kwargs):
+        return await self._run(self._client.upload_file, file_path, bucket_name, key, **kwargs)
+
+    async def get_object(self, bucket_name, key, **kwargs):
+        # returns the body bytes; the read happens on the pool as well
+        def get_body():
+            return self._client.get_object(Bucket=bucket_name, Key=key, **kwargs)['Body'].read()
+        return await self._run(get_body)
+
+    async def list_objects(self, bucket_name, prefix='', delimiter=None):
+        # async generator over the paginated listing, one page fetch at a time
+        pages = iter_object_pages(self._client, bucket_name, prefix, delimiter)
+        done = object()
+        while True:
+            page = await self._run(next, pages, done)
+            if page is done:
+                return
+            for obj in page.get('Contents', []):
+                yield obj
+
+    async def delete_object(self, bucket_name, key, **kwargs):
+        return await self._run(self._client.delete_object, Bucket=bucket_name, Key=key, **kwargs)
+
+    async def delete_objects(self, bucket_name, keys):
+        # batched delete_objects; returns (deleted_count, errors)
+        objects = [key if isinstance(key, dict) else {'Key': key} for key in keys]
+        return await self._run(delete_object_batches, self._client, bucket_name, objects, 1)
+
+    async def copy_object(self, bucket_name, key, source_bucket, source_key, version_id=None, **kwargs):
+        copy_source = {'Bucket': source_bucket, 'Key': source_key}
+        if version_id:
+            copy_source['VersionId'] = version_id
+        return await self._run(self._client.copy_object, Bucket=bucket_name, Key=key,
+                               CopySource=copy_source, **kwargs)
+
+    async def upload_large_file(self, file_path, bucket_name, key, part_size=None,
+                                max_retries=DEFAULT_MAX_RETRIES):
+        # multipart upload with every part scheduled on the event loop; the
+        # semaphore bounds how many parts are in flight. part_size=None picks
+        # it from the file size
+        file_size = os.path.getsize(file_path)
+        if part_size is None:
+            part_size = auto_part_size(file_size)
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part size must be at least {MIN_PART_SIZE} bytes")
+        parts_plan = plan_parts(file_size, part_size)
+        if len(parts_plan) > MAX_PARTS:
+            raise ValueError(f"file needs {len(parts_plan)} parts, S3 allows at most {MAX_PARTS}")
+
+        mpu = await self._run(self._client.create_multipart_upload, Bucket=bucket_name, Key=key)
+        upload_id = mpu['UploadId']
+        part_source = open_part_source(file_path)
+
+        failed = False
+
+        async def upload_part(part_number, offset, length):
+            nonlocal failed
+            async with self._semaphore:
+                # checked once a slot is free, so parts still waiting for
+                # one are skipped after another part has failed
+                if failed:
+                    return None
+                try:
+                    return await self._call(upload_part_with_retry, self._client, bucket_name, key,
+                                            upload_id, part_source, part_number, offset, length,
+                                            max_retries)
+                except Exception:
+                    failed = True
+                    raise
+
+        try:
+            # every started part is awaited before the file mapping is closed
+            results = await asyncio.gather(*(upload_part(*part) for part in parts_plan),
+                                           return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return await self._run(self._client.complete_multipart_upload, Bucket=bucket_name, Key=key,
+                                   MultipartUpload={'Parts': results}, UploadId=upload_id)
+        except BaseException:
+            await self._run(self._client.abort_multipart_upload, Bucket=bucket_name, Key=key,
+                            UploadId=upload_id)
+            raise
+        finally:
+            part_source.close()
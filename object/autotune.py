@@ -0,0 +1,160 @@
+#autotune
+
+import math
+import threading
+import time
+
+from object.multipart import (MIB, MIN_PART_SIZE, MAX_PARTS, DEFAULT_MAX_RETRIES,
+                              upload_part_with_retry, run_parts)
+from object.ratelimit import is_throttle_error
+
+
+MAX_PART_SIZE = 5 * 1024 * MIB
+MAX_OBJECT_SIZE = 5 * 1024 * 1024 * MIB
+# parts start at 8 MiB and double until the upload needs at most
+# TARGET_PARTS requests; past MAX_AUTO_PART_SIZE the part count grows
+# instead, until the 10,000-part limit forces bigger parts again
+AUTO_PART_SIZE = 8 * MIB
+MAX_AUTO_PART_SIZE = 128 * MIB
+TARGET_PARTS = 1000
+MAX_AUTO_CONCURRENCY = 32
+
+
+def auto_part_size(file_size):
+    if file_size > MAX_OBJECT_SIZE:
+        raise ValueError(f"{file_size} bytes is more than the S3 object limit of {MAX_OBJECT_SIZE}")
+    part_size = AUTO_PART_SIZE
+    while math.ceil(file_size / part_size) > TARGET_PARTS and part_size < MAX_AUTO_PART_SIZE:
+        part_size *= 2
+    # whole MiB parts keep the multipart ETag reproducible from the size alone
+    smallest = math.ceil(file_size / MAX_PARTS / MIB) * MIB
+    return min(max(part_size, smallest, MIN_PART_SIZE), MAX_PART_SIZE)
+
+
+def pool_limit(aws_s3_client):
+    # more parts in flight than pooled connections only queues requests
+    max_pool_connections = getattr(aws_s3_client.meta.config, 'max_pool_connections', None) or 10
+    return min(MAX_AUTO_CONCURRENCY, max_pool_connections)
+
+
+class ConcurrencyTuner:
+    # hill-climbs the number of parts in flight. Every window of `limit`
+    # finished parts the aggregate throughput is compared with the previous
+    # window: a gain keeps moving in the same direction, a loss turns around
+    # and no change steps down, so the limit settles around the knee.
+    # Throttling, or retries botocore had to make, halves the limit, at most
+    # once per window so a burst of SlowDown replies does not collapse it to 1.
+
+    def __init__(self, initial=4, minimum=1, maximum=MAX_AUTO_CONCURRENCY, gain=0.05):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.gain = gain
+        self.history = [self.limit]
+        self._step = 1
+        self._in_flight = 0
+        self._since_backoff = None
+        self._condition = threading.Condition()
+        self._reset_window(None)
+
+    def _reset_window(self, throughput):
+        self._previous_throughput = throughput
+        self._window_bytes = 0
+        self._window_parts = 0
+        self._window_errors = 0
+        self._window_start = time.perf_counter()
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _set_limit(self, limit):
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit != self.limit:
+            self.limit = limit
+            self.history.append(limit)
+            self._condition.notify_all()
+
+    def _back_off(self):
+        if self._since_backoff is not None and self._since_backoff < self.limit:
+            return
+        self._since_backoff = 0
+        self._step = 1
+        self._set_limit(self.limit // 2)
+        self._reset_window(None)
+
+    def part_done(self, length, retries=0):
+        with self._condition:
+            if self._since_backoff is not None:
+                self._since_backoff += 1
+            if retries:
+                self._back_off()
+                return
+            self._window_bytes += length
+            self._window_parts += 1
+            if self._window_parts < self.limit:
+                return
+            elapsed = max(time.perf_counter() - self._window_start, 1e-6)
+            throughput = self._window_bytes / elapsed
+            previous = self._previous_throughput
+            if self._window_errors > self._window_parts // 10:
+                self._step = -1
+            elif previous is None or throughput > previous * (1 + self.gain):
+                pass
+            elif throughput < previous * (1 - self.gain):
+                self._step = -self._step
+            else:
+                # no gain: the same throughput with fewer connections is better
+                self._step = -1
+            self._set_limit(self.limit + self._step)
+            self._reset_window(throughput)
+
+    def part_failed(self, error):
+        with self._condition:
+            if is_throttle_error(error):
+                self._back_off()
+            else:
+                self._window_errors += 1
+
+
+def upload_parts_adaptive(aws_s3_client, part_source, bucket_name, object_name, upload_id, parts,
+                          tuner, max_retries=DEFAULT_MAX_RETRIES, on_part_done=None):
+    # upload_parts_concurrently with the number of parts in flight set by
+    # the tuner instead of a fixed pool size
+    failed = threading.Event()
+
+    def upload(part_number, offset, length):
+        tuner.acquire()
+        try:
+            # every worker is already running while it waits on the tuner, so
+            # cancelling its future cannot stop it; parts check this instead
+            if failed.is_set():
+                return None
+            return upload_part_with_retry(
+                aws_s3_client, bucket_name, object_name, upload_id, part_source,
+                part_number, offset, length, max_retries, on_error=tuner.part_failed,
+                on_success=lambda response: tuner.part_done(
+                    length, response.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+            )
+        except Exception:
+            failed.set()
+            raise
+        finally:
+            tuner.release()
+
+    def part_done(part, finished):
+        if part is None:
+            return
+        if on_part_done:
+            on_part_done(part)
+        print(f"Uploaded part {finished}/{len(parts)} (parts in flight: {tuner.limit})")
+
+    completed = run_parts(upload, parts, tuner.maximum, part_done)
+    return sorted(completed, key=lambda part: part['PartNumber'])
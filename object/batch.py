@@ -0,0 +1,150 @@
+#batch
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+
+from object.crud import restore_object_version
+from object.policy import set_object_access_policy
+
+
+# futures kept in flight per worker, so a huge manifest is streamed instead
+# of being turned into millions of pending futures up front
+QUEUE_DEPTH = 4
+
+
+def run_upload(aws_s3_client, operation):
+    aws_s3_client.upload_file(operation['file'], operation['bucket'], operation['key'])
+
+
+def run_delete(aws_s3_client, operation):
+    kwargs = {'Bucket': operation['bucket'], 'Key': operation['key']}
+    if operation.get('version_id'):
+        kwargs['VersionId'] = operation['version_id']
+    aws_s3_client.delete_object(**kwargs)
+
+
+def run_copy(aws_s3_client, operation):
+    # managed copy, switches to a multipart copy for objects above 5GiB
+    copy_source = {'Bucket': operation.get('source_bucket') or operation['bucket'],
+                   'Key': operation['source_key']}
+    if operation.get('version_id'):
+        copy_source['VersionId'] = operation['version_id']
+    aws_s3_client.copy(copy_source, operation['bucket'], operation['key'])
+
+
+def run_restore(aws_s3_client, operation):
+    restore_object_version(aws_s3_client, operation['bucket'], operation['key'], operation['version_id'])
+
+
+def run_acl(aws_s3_client, operation):
+    if not set_object_access_policy(aws_s3_client, operation['bucket'], operation['key'],
+                                    operation.get('acl') or 'public-read'):
+        raise RuntimeError("put_object_acl did not return 200")
+
+
+OPERATIONS = {
+    'upload': (run_upload, ('file',)),
+    'delete': (run_delete, ('key',)),
+    'copy': (run_copy, ('key', 'source_key')),
+    'restore': (run_restore, ('key', 'version_id')),
+    'acl': (run_acl, ('key',)),
+}
+
+
+def read_manifest(manifest_path):
+    # yields (line_number, operation or None, parse error or None); .csv files
+    # need a header row with the field names, anything else is read as JSONL
+    with open(manifest_path, newline='') as manifest_file:
+        if manifest_path.lower().endswith('.csv'):
+            reader = csv.DictReader(manifest_file)
+            for row in reader:
+                yield reader.line_num, {name: value for name, value in row.items() if name and value}, None
+            return
+        for line_number, line in enumerate(manifest_file, 1):
+            if not line.strip():
+                continue
+            try:
+                operation = json.loads(line)
+                if not isinstance(operation, dict):
+                    raise ValueError("expected a JSON object")
+                yield line_number, operation, None
+            except ValueError as e:
+                yield line_number, None, f"invalid JSON: {e}"
+
+
+def check_operation(operation, default_bucket):
+    if operation.get('bucket') is None:
+        operation['bucket'] = default_bucket
+    name = operation.get('op')
+    if name not in OPERATIONS:
+        return f"unknown op {name!r}, expected one of {', '.join(OPERATIONS)}"
+    if name == 'upload' and operation.get('file') and not operation.get('key'):
+        operation['key'] = os.path.basename(operation['file'])
+    missing = [field for field in ('bucket',) + OPERATIONS[name][1] if not operation.get(field)]
+    if missing:
+        return f"missing {', '.join(missing)} for {name}"
+    return None
+
+
+def run_operation(aws_s3_client, operation):
+    started = time.perf_counter()
+    OPERATIONS[operation['op']][0](aws_s3_client, operation)
+    return time.perf_counter() - started
+
+
+def run_manifest(aws_s3_client, manifest_path, results_path=None, concurrency=8, default_bucket=None):
+    # runs every line of the manifest through one shared client and worker
+    # pool; each line gets a JSON result line in results_path, in completion
+    # order. Lines run concurrently, so operations on the same key are not
+    # ordered unless concurrency=1. returns (succeeded, failed)
+    if results_path is None:
+        results_path = f"{manifest_path}.results.jsonl"
+
+    succeeded = 0
+    failed = 0
+    concurrency = max(1, concurrency)
+
+    with open(results_path, 'w') as results_file, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def record(line_number, operation, error=None, seconds=None):
+            nonlocal succeeded, failed
+            result = {'line': line_number, 'op': operation.get('op') if operation else None,
+                      'bucket': operation.get('bucket') if operation else None,
+                      'key': operation.get('key') if operation else None,
+                      'status': 'error' if error else 'ok'}
+            if error:
+                result['error'] = error
+                failed += 1
+            else:
+                result['seconds'] = round(seconds, 4)
+                succeeded += 1
+            results_file.write(json.dumps(result) + '\n')
+
+        futures = {}
+
+        def drain(return_when):
+            done, _ = wait(futures, return_when=return_when)
+            for future in done:
+                line_number, operation = futures.pop(future)
+                try:
+                    record(line_number, operation, seconds=future.result())
+                except Exception as e:
+                    record(line_number, operation, error=str(e))
+
+        for line_number, operation, error in read_manifest(manifest_path):
+            error = error or check_operation(operation, default_bucket)
+            if error:
+                record(line_number, operation, error=error)
+                continue
+            futures[executor.submit(run_operation, aws_s3_client, operation)] = (line_number, operation)
+            if len(futures) >= concurrency * QUEUE_DEPTH:
+                drain(FIRST_COMPLETED)
+        if futures:
+            drain(ALL_COMPLETED)
+
+    print(f"Manifest summary: {succeeded} succeeded, {failed} failed, results in {results_path}")
+    return succeeded, failed
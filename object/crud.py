@@ -5,40 +5,187 @@ import io
 from hashlib import md5
 from time import localtime
 import os
+import threading
+from contextlib import closing
 import uuid 
 import json
+from object.multipart import (MIB, MIN_PART_SIZE, MAX_PARTS, MAX_COPY_OBJECT_SIZE,
+                              DEFAULT_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_RANGE_SIZE,
+                              plan_parts, open_part_source, upload_parts_concurrently,
+                              journal_path_for, remove_journal, new_journal, journal_matches,
+                              list_uploaded_parts, verified_parts, copy_object_multipart,
+                              download_ranges_concurrently)
+from object.etag import is_unchanged
+from object.jsonfile import load_json_file, save_json_file
 
 
 
-def get_objects(aws_s3_client, bucket_name) -> str:
-  for key in aws_s3_client.list_objects(Bucket=bucket_name)['Contents']:
+def iter_object_pages(aws_s3_client, bucket_name, prefix='', delimiter=None):
+  kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+  if delimiter:
+    kwargs['Delimiter'] = delimiter
+  paginator = aws_s3_client.get_paginator('list_objects_v2')
+  yield from paginator.paginate(**kwargs)
+
+
+def iter_objects(aws_s3_client, bucket_name, prefix='', delimiter=None):
+  # streams every object under prefix, one page (up to 1000 keys) at a time
+  for page in iter_object_pages(aws_s3_client, bucket_name, prefix, delimiter):
+    yield from page.get('Contents', [])
+
+
+def iter_objects_parallel(aws_s3_client, bucket_name, prefix='', delimiter='/', concurrency=8):
+  # splits the keyspace by the common prefixes under prefix and lists the
+  # shards concurrently; objects arrive in shard completion order, not key order
+  import queue
+  from concurrent.futures import ThreadPoolExecutor
+
+  done = object()
+  pages = queue.Queue(maxsize=concurrency * 2)
+  stop = threading.Event()
+  remaining = 0
+
+  def list_shard(shard_prefix):
+    try:
+      if stop.is_set():
+        return
+      for page in iter_object_pages(aws_s3_client, bucket_name, shard_prefix):
+        if stop.is_set():
+          return
+        pages.put(page.get('Contents', []))
+    except Exception as e:
+      pages.put(e)
+    finally:
+      pages.put(done)
+
+  def take(item):
+    nonlocal remaining
+    if item is done:
+      remaining -= 1
+      return []
+    if isinstance(item, Exception):
+      raise item
+    return item
+
+  with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+    try:
+      # a single delimiter pass over the top level: its Contents are the
+      # objects directly under prefix, and every common prefix is handed to
+      # a worker as soon as its page arrives
+      for page in iter_object_pages(aws_s3_client, bucket_name, prefix, delimiter):
+        for common in page.get('CommonPrefixes', []):
+          executor.submit(list_shard, common['Prefix'])
+          remaining += 1
+        yield from page.get('Contents', [])
+        while True:
+          try:
+            item = pages.get_nowait()
+          except queue.Empty:
+            break
+          yield from take(item)
+
+      while remaining:
+        yield from take(pages.get())
+    finally:
+      stop.set()
+      # unblock shards waiting on a full queue
+      while remaining:
+        if pages.get() is done:
+          remaining -= 1
+
+
+def get_objects(aws_s3_client, bucket_name, prefix='', parallel=False, concurrency=8,
+                index_path=None) -> int:
+  if index_path:
+    from object.index import open_index, query_objects
+    with closing(open_index(index_path)) as connection:
+      rows = query_objects(connection, bucket_name, prefix)
+    for row in rows:
+      print(f" {row['key']}, size: {row['size']}")
+    print(f"Total objects: {len(rows)}")
+    return len(rows)
+
+  if parallel:
+    objects = iter_objects_parallel(aws_s3_client, bucket_name, prefix, concurrency=concurrency)
+  else:
+    objects = iter_objects(aws_s3_client, bucket_name, prefix)
+
+  count = 0
+  for key in objects:
     print(f" {key['Key']}, size: {key['Size']}")
+    count += 1
+  print(f"Total objects: {count}")
+  return count
+
+
+class TeeReader:
+  # passes reads through to the HTTP response and copies them to a local file
+
+  def __init__(self, source, local_file):
+    self._source = source
+    self._local_file = local_file
+
+  def read(self, size=-1):
+    data = self._source.read(size)
+    if data:
+      self._local_file.write(data)
+    return data
+
+
+def refresh_object_index(aws_s3_client, bucket_name, index_path, prefixes=None):
+  from object.index import open_index, refresh_index
+  with closing(open_index(index_path)) as connection:
+    changed = refresh_index(connection, aws_s3_client, bucket_name, prefixes)
+  print(f"Index {index_path} refreshed, {changed} new or changed objects")
+  return changed
 
 
 def download_file_and_upload_to_s3(aws_s3_client,
                                    bucket_name,
                                    url,
-                                   keep_local=False) -> str:
-  file_name = f'image_file_{md5(str(localtime()).encode("utf-8")).hexdigest()}.jpg'
+                                   keep_local=False,
+                                   chunk_size=8 * MIB,
+                                   concurrency=4) -> str:
+  import mimetypes
+  from boto3.s3.transfer import TransferConfig
+
+  # the response is streamed into a multipart upload; s3transfer buffers a
+  # bounded number of chunk_size chunks, so memory does not grow with the body
+  config = TransferConfig(multipart_threshold=chunk_size,
+                          multipart_chunksize=chunk_size,
+                          max_concurrency=concurrency)
   with urlopen(url) as response:
-    content = response.read()
-    aws_s3_client.upload_fileobj(Fileobj=io.BytesIO(content),
-                                 Bucket=bucket_name,
-                                 ExtraArgs={'ContentType': 'image/jpg'},
-                                 Key=file_name)
-  if keep_local:
-    with open(file_name, mode='wb') as jpg_file:
-      jpg_file.write(content)
+    content_type = response.headers.get_content_type() or 'application/octet-stream'
+    extension = mimetypes.guess_extension(content_type) or '.jpg'
+    file_name = f'image_file_{md5(str(localtime()).encode("utf-8")).hexdigest()}{extension}'
+
+    if keep_local:
+      with open(file_name, mode='wb') as local_file:
+        aws_s3_client.upload_fileobj(Fileobj=TeeReader(response, local_file),
+                                     Bucket=bucket_name,
+                                     ExtraArgs={'ContentType': content_type},
+                                     Key=file_name,
+                                     Config=config)
+    else:
+      aws_s3_client.upload_fileobj(Fileobj=response,
+                                   Bucket=bucket_name,
+                                   ExtraArgs={'ContentType': content_type},
+                                   Key=file_name,
+                                   Config=config)
   return "https://s3-{0}.amazonaws.com/{1}/{2}".format('us-west-2',
                                                        bucket_name, file_name)
 
 
-def upload_file(aws_s3_client, filename, bucket_name):
+def upload_file(aws_s3_client, filename, bucket_name, skip_unchanged=False, remote_objects=None):
 
     import os
     object_name = os.path.basename(filename)
     
     try:
+        if skip_unchanged and is_unchanged(aws_s3_client, bucket_name, object_name, filename,
+                                           remote_objects=remote_objects):
+            print(f"{object_name} is unchanged in {bucket_name}, skipping upload")
+            return True
         aws_s3_client.upload_file(filename, bucket_name, object_name)
         return True
     except Exception as e:
@@ -57,70 +204,185 @@ def upload_file_put(aws_s3_client, filename, bucket_name):
                              Key="hello_put.txt",
                              Body=file.read())
 
-def upload_large_file(aws_s3_client, file_path, bucket_name, object_name=None):
+def abort_journal_upload(aws_s3_client, journal):
+    # parts of an upload that is never completed stay stored (and billed)
+    # until it is aborted
+    try:
+        aws_s3_client.abort_multipart_upload(Bucket=journal['Bucket'], Key=journal['Key'],
+                                             UploadId=journal['UploadId'])
+        print(f"Aborted upload {journal['UploadId']}")
+    except Exception as e:
+        print(f"Could not abort upload {journal.get('UploadId')}: {e}")
+
+
+def upload_large_file(aws_s3_client, file_path, bucket_name, object_name=None,
+                      part_size=None, concurrency=DEFAULT_CONCURRENCY,
+                      max_retries=DEFAULT_MAX_RETRIES, resume=False, journal_path=None,
+                      use_mmap=True, skip_unchanged=False, autotune=True, max_concurrency=None):
+    # part_size=None picks the part size from the file size. With autotune
+    # the upload starts with `concurrency` parts in flight and a tuner moves
+    # that between 1 and max_concurrency from the measured throughput.
 
     import os
-    
+    from object.autotune import auto_part_size, ConcurrencyTuner, upload_parts_adaptive, pool_limit
 
     if object_name is None:
         object_name = os.path.basename(file_path)
-    
-    mpu = aws_s3_client.create_multipart_upload(Bucket=bucket_name, Key=object_name)
-    
+
     file_size = os.path.getsize(file_path)
-    
-    chunk_size = 5 * 1024 * 1024
-    chunk_count = int(file_size / chunk_size) + 1
+    if part_size is None:
+        try:
+            part_size = auto_part_size(file_size)
+        except ValueError as e:
+            print(f"Cannot upload {file_path}: {e}")
+            return False
 
-    parts = []
-    
-    try:
-        print(f"Uploading file {file_path} to {bucket_name}/{object_name}")
-        print(f"Total parts: {chunk_count}")
-        
+    if skip_unchanged and is_unchanged(aws_s3_client, bucket_name, object_name, file_path, part_size):
+        print(f"{object_name} is unchanged in {bucket_name}, skipping upload")
+        return True
 
-        with open(file_path, 'rb') as file:
-            for i in range(chunk_count):
+    if journal_path is None:
+        journal_path = journal_path_for(file_path)
+
+    journal = None
+    done_parts = {}
+    if resume:
+        journal = load_json_file(journal_path)
+        if journal and not journal_matches(journal, file_path, bucket_name, object_name):
+            print(f"Journal {journal_path} does not match {file_path}, starting a new upload")
+            abort_journal_upload(aws_s3_client, journal)
+            journal = None
+        if journal:
+            try:
+                uploaded = list_uploaded_parts(aws_s3_client, bucket_name, object_name, journal['UploadId'])
+                done_parts = verified_parts(journal, uploaded)
+                part_size = journal['PartSize']
+                print(f"Resuming upload {journal['UploadId']}: {len(done_parts)} parts already uploaded")
+            except Exception as e:
+                print(f"Cannot resume upload {journal['UploadId']} ({e}), starting a new upload")
+                abort_journal_upload(aws_s3_client, journal)
+                journal = None
+                done_parts = {}
+
+    if part_size < MIN_PART_SIZE:
+        print(f"Part size must be at least {MIN_PART_SIZE // MIB} MiB")
+        return False
 
-                file.seek(chunk_size * i)
+    parts_plan = plan_parts(file_size, part_size)
+    if len(parts_plan) > MAX_PARTS:
+        print(f"File needs {len(parts_plan)} parts, S3 allows at most {MAX_PARTS}. Increase the part size.")
+        return False
 
-                data = file.read(min(chunk_size, file_size - chunk_size * i))
-                
-                part = aws_s3_client.upload_part(
-                    Body=data,
-                    Bucket=bucket_name,
-                    Key=object_name,
-                    PartNumber=i + 1,
-                    UploadId=mpu['UploadId']
+    if journal:
+        upload_id = journal['UploadId']
+    else:
+        upload_id = aws_s3_client.create_multipart_upload(Bucket=bucket_name, Key=object_name)['UploadId']
+        if resume:
+            journal = new_journal(file_path, bucket_name, object_name, upload_id, part_size)
+            save_json_file(journal_path, journal)
+
+    def record_part(part):
+        journal['Parts'][str(part['PartNumber'])] = part['ETag']
+        save_json_file(journal_path, journal)
+
+    missing_parts = [part for part in parts_plan if part[0] not in done_parts]
+    
+    try:
+        print(f"Uploading file {file_path} to {bucket_name}/{object_name}")
+        if autotune:
+            tuner = ConcurrencyTuner(initial=concurrency,
+                                     maximum=max_concurrency or max(concurrency, pool_limit(aws_s3_client)))
+            concurrency_note = f"auto ({tuner.limit} to start, at most {tuner.maximum})"
+        else:
+            concurrency_note = concurrency
+        print(f"Total parts: {len(parts_plan)}, part size: {part_size // MIB} MiB, concurrency: {concurrency_note}")
+        if done_parts:
+            print(f"Skipping {len(done_parts)} parts uploaded by a previous run")
+
+        part_source = open_part_source(file_path, use_mmap)
+        try:
+            if autotune:
+                parts = upload_parts_adaptive(
+                    aws_s3_client, part_source, bucket_name, object_name, upload_id,
+                    missing_parts, tuner, max_retries=max_retries,
+                    on_part_done=record_part if resume else None
                 )
-                
-                parts.append({
-                    'PartNumber': i + 1,
-                    'ETag': part['ETag']
-                })
-                
-                print(f"Uploaded part {i + 1}/{chunk_count}")
+                print(f"Parts in flight went {' -> '.join(str(limit) for limit in tuner.history)}")
+            else:
+                parts = upload_parts_concurrently(
+                    aws_s3_client, part_source, bucket_name, object_name, upload_id,
+                    missing_parts, concurrency=concurrency, max_retries=max_retries,
+                    on_part_done=record_part if resume else None
+                )
+        finally:
+            part_source.close()
+        parts += [{'PartNumber': number, 'ETag': etag} for number, etag in done_parts.items()]
+        parts.sort(key=lambda part: part['PartNumber'])
         
         aws_s3_client.complete_multipart_upload(
             Bucket=bucket_name,
             Key=object_name,
             MultipartUpload={'Parts': parts},
-            UploadId=mpu['UploadId']
+            UploadId=upload_id
         )
+        if resume:
+            remove_journal(journal_path)
         
         print(f"Upload completed for {object_name}")
         return True
     
     except Exception as e:
+        if resume:
+            print(f"Upload failed: {e}")
+            print(f"Progress saved to {journal_path}, rerun with resume to continue")
+            return False
         aws_s3_client.abort_multipart_upload(
             Bucket=bucket_name,
             Key=object_name,
-            UploadId=mpu['UploadId']
+            UploadId=upload_id
         )
         print(f"Upload failed: {e}")
         return False
 
 
+def download_large_file(aws_s3_client, bucket_name, object_name, file_path=None,
+                        part_size=None, concurrency=DEFAULT_CONCURRENCY,
+                        max_retries=DEFAULT_MAX_RETRIES):
+
+    if part_size is None:
+        part_size = DEFAULT_RANGE_SIZE
+    if file_path is None:
+        file_path = os.path.basename(object_name)
+    tmp_path = f"{file_path}.download"
+
+    try:
+        # IfMatch on every range makes sure all of them come from the same object
+        head = aws_s3_client.head_object(Bucket=bucket_name, Key=object_name)
+        object_size = head['ContentLength']
+        ranges = plan_parts(object_size, part_size)
+
+        print(f"Downloading {bucket_name}/{object_name} to {file_path}")
+        print(f"Total ranges: {len(ranges)}, range size: {part_size // MIB} MiB, concurrency: {concurrency}")
+
+        file_descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(file_descriptor, object_size)
+            download_ranges_concurrently(aws_s3_client, bucket_name, object_name, head['ETag'],
+                                         file_descriptor, ranges, concurrency=concurrency,
+                                         max_retries=max_retries)
+        finally:
+            os.close(file_descriptor)
+
+        os.replace(tmp_path, file_path)
+        print(f"Download completed for {object_name}")
+        return True
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"Download failed: {e}")
+        return False
+
+
 def delete_object_from_bucket(aws_s3_client, bucket_name, file_key):
     try:
         aws_s3_client.delete_object(Bucket=bucket_name, Key=file_key)
@@ -131,10 +393,55 @@ def delete_object_from_bucket(aws_s3_client, bucket_name, file_key):
         return False
 
 
-def get_file_versions(aws_s3_client, bucket_name, file_key):
+def iter_file_versions(aws_s3_client, bucket_name, file_key, limit=None, include_delete_markers=False):
+    # versions of exactly file_key, newest first. Listing by prefix returns
+    # file_key before any longer key that shares it (report.csv before
+    # report.csv.bak), so paging stops at the first other key or at limit.
+    kwargs = {'Bucket': bucket_name, 'Prefix': file_key}
+    if limit:
+        kwargs['MaxKeys'] = min(1000, limit + 1)
+    found = 0
+
+    while True:
+        response = aws_s3_client.list_object_versions(**kwargs)
+        entries = response.get('Versions', [])
+        if include_delete_markers:
+            entries = entries + response.get('DeleteMarkers', [])
+        matching = [entry for entry in entries if entry['Key'] == file_key]
+        if include_delete_markers:
+            matching.sort(key=lambda entry: entry['LastModified'], reverse=True)
+
+        for entry in matching:
+            yield entry
+            found += 1
+            if limit and found >= limit:
+                return
+
+        if (len(matching) < len(entries) or not response.get('IsTruncated', False)
+                or response.get('NextKeyMarker') != file_key):
+            return
+        kwargs['KeyMarker'] = response['NextKeyMarker']
+        kwargs['VersionIdMarker'] = response['NextVersionIdMarker']
+
+
+def get_file_versions(aws_s3_client, bucket_name, file_key, index_path=None):
+    if index_path:
+        import datetime
+        from object.index import open_index, query_versions
+        with closing(open_index(index_path)) as connection:
+            versions = query_versions(connection, bucket_name, file_key)
+        if versions:
+            print(f"Versions for file '{file_key}' in bucket '{bucket_name}':")
+            for version in versions:
+                last_modified = datetime.datetime.fromtimestamp(version['last_modified'], datetime.timezone.utc)
+                print(f"Version ID: {version['version_id']}, Last Modified: {last_modified}")
+            print(f"Total versions: {len(versions)}")
+        else:
+            print(f"No versions found for file '{file_key}' in bucket '{bucket_name}'.")
+        return
+
     try:
-        response = aws_s3_client.list_object_versions(Bucket=bucket_name, Prefix=file_key)
-        versions = response.get('Versions', [])
+        versions = list(iter_file_versions(aws_s3_client, bucket_name, file_key))
         if versions:
             print(f"Versions for file '{file_key}' in bucket '{bucket_name}':")
             for version in versions:
@@ -146,10 +453,31 @@ def get_file_versions(aws_s3_client, bucket_name, file_key):
         print(f"Error listing versions for file '{file_key}': {e}")
 
 
-def upload_previous_version(aws_s3_client, bucket_name, file_key):
+def restore_object_version(aws_s3_client, bucket_name, file_key, version_id, object_size=None,
+                           concurrency=DEFAULT_CONCURRENCY):
+    # makes version_id the current version with a server-side copy
+    copy_source = {'Bucket': bucket_name, 'Key': file_key, 'VersionId': version_id}
+
+    if object_size is None:
+        object_size = aws_s3_client.head_object(Bucket=bucket_name, Key=file_key,
+                                                VersionId=version_id)['ContentLength']
+
+    if object_size <= MAX_COPY_OBJECT_SIZE:
+        return aws_s3_client.copy_object(Bucket=bucket_name, Key=file_key, CopySource=copy_source)
+
+    # multipart copies do not carry over metadata, pass it on explicitly
+    head = aws_s3_client.head_object(Bucket=bucket_name, Key=file_key, VersionId=version_id)
+    extra_args = {'Metadata': head.get('Metadata', {})}
+    for name in ('ContentType', 'ContentEncoding', 'ContentDisposition', 'ContentLanguage', 'CacheControl'):
+        if head.get(name):
+            extra_args[name] = head[name]
+    return copy_object_multipart(aws_s3_client, bucket_name, file_key, copy_source, object_size,
+                                 concurrency=concurrency, extra_args=extra_args)
+
+
+def upload_previous_version(aws_s3_client, bucket_name, file_key, concurrency=DEFAULT_CONCURRENCY):
     try:
-        response = aws_s3_client.list_object_versions(Bucket=bucket_name, Prefix=file_key)
-        versions = response.get('Versions', [])
+        versions = list(iter_file_versions(aws_s3_client, bucket_name, file_key, limit=2))
 
         if len(versions) < 2:
             print(f"Not enough versions for file '{file_key}' to upload the previous version.")
@@ -158,10 +486,8 @@ def upload_previous_version(aws_s3_client, bucket_name, file_key):
         previous_version = versions[1]  
         version_id = previous_version['VersionId']
 
-        file_obj = aws_s3_client.get_object(Bucket=bucket_name, Key=file_key, VersionId=version_id)
-        file_content = file_obj['Body'].read()
-
-        aws_s3_client.put_object(Bucket=bucket_name, Key=file_key, Body=file_content)
+        restore_object_version(aws_s3_client, bucket_name, file_key, version_id,
+                               previous_version.get('Size'), concurrency)
         print(f"Successfully uploaded the previous version of '{file_key}' as a new version.")
         return True
     except Exception as e:
@@ -170,28 +496,62 @@ def upload_previous_version(aws_s3_client, bucket_name, file_key):
 
 
 
-def upload_file_by_type(aws_s3_client, file_path, bucket_name):
+def type_folder_key(file_path, relative_path=None):
+    # <ext>/<relative_path>; folder uploads pass the path below the folder
+    # so files with the same name in different directories do not collide
+    import os
+
+    file_name = os.path.basename(file_path)
+    _, file_extension = os.path.splitext(file_name)
+    folder_name = file_extension[1:].lower() if file_extension else "no_extension"
+    return f"{folder_name}/{relative_path or file_name}"
+
+
+def upload_folder_by_type(aws_s3_client, folder_path, bucket_name, concurrency=1, processes=None):
+    # batch version of upload_file_by_type for a whole directory tree
+    from object.mime import classify_files
+
+    try:
+        folder_files = [(local_path, relative_path)
+                        for local_path, relative_path, _ in collect_folder_files(folder_path)]
+        mime_types = classify_files([local_path for local_path, _ in folder_files], processes)
+        files_to_upload = [(local_path, type_folder_key(local_path, relative_path), mime_types[local_path])
+                           for local_path, relative_path in folder_files]
+
+        uploaded_files, errors = upload_files_concurrently(
+            aws_s3_client, bucket_name, files_to_upload, concurrency
+        )
+        print(f"Upload summary: {uploaded_files} files uploaded, {len(errors)} errors")
+        print_upload_errors(errors)
+        return not errors
+    except Exception as e:
+        print(f"Error uploading folder by type: {e}")
+        return False
+
+
+def upload_file_by_type(aws_s3_client, file_path, bucket_name, skip_unchanged=False):
 
     import os
-    import magic
+    from object.mime import sniff_mime_type
     
     try:
 
         file_name = os.path.basename(file_path)
+        s3_key = type_folder_key(file_path)
         _, file_extension = os.path.splitext(file_name)
+        folder_name = s3_key.split('/', 1)[0]
 
-        folder_name = file_extension[1:].lower() if file_extension else "no_extension"
-
-        mime = magic.Magic(mime=True)
-        file_type = mime.from_file(file_path)
-        
-        s3_key = f"{folder_name}/{file_name}"
+        file_type = sniff_mime_type(file_path)
         
         print(f"File extension: {file_extension}")
         print(f"Uploading to folder: {folder_name}")
         print(f"Detected MIME type: {file_type}")
         print(f"Full S3 path: {bucket_name}/{s3_key}")
 
+        if skip_unchanged and is_unchanged(aws_s3_client, bucket_name, s3_key, file_path):
+            print(f"{s3_key} is unchanged in {bucket_name}, skipping upload")
+            return True
+
         aws_s3_client.upload_file(
             file_path, 
             bucket_name, 
@@ -207,11 +567,22 @@ def upload_file_by_type(aws_s3_client, file_path, bucket_name):
     
 
 
-def check_and_delete_old_versions(aws_s3_client, bucket_name, file_key=None, months=6):
-    import datetime
+def check_and_delete_old_versions(aws_s3_client, bucket_name, file_key=None, months=6, concurrency=4,
+                                  sharded=False, checkpoint_path=None, dry_run=False, index_path=None):
+    if not file_key and index_path:
+        return delete_old_versions_from_index(aws_s3_client, bucket_name, index_path, months,
+                                              concurrency, dry_run)
+
+    if not file_key and (sharded or checkpoint_path or dry_run):
+        from object.version_cleanup import cleanup_old_versions_sharded
+        try:
+            return cleanup_old_versions_sharded(aws_s3_client, bucket_name, months, concurrency,
+                                                checkpoint_path=checkpoint_path, dry_run=dry_run)
+        except Exception as e:
+            print(f"Error checking/deleting versions: {e}")
+            return 0
 
-    current_date = datetime.datetime.now(datetime.timezone.utc)
-    cutoff_date = current_date - datetime.timedelta(days=30 * months)
+    cutoff_date = version_cutoff(months)
     
     print(f"Checking for versions older than {cutoff_date.strftime('%Y-%m-%d')}")
     
@@ -219,22 +590,37 @@ def check_and_delete_old_versions(aws_s3_client, bucket_name, file_key=None, mon
     
     try:
         if file_key:
-            response = aws_s3_client.list_object_versions(Bucket=bucket_name, Prefix=file_key)
             print(f"Checking versions for file: {file_key}")
-            deleted_count += process_versions(aws_s3_client, bucket_name, response, cutoff_date)
+            entries = [entry for entry in iter_file_versions(aws_s3_client, bucket_name, file_key,
+                                                             include_delete_markers=True)
+                       if entry['LastModified'] < cutoff_date]
+            if dry_run:
+                # delete markers have no Size
+                print(f"Would delete {len(entries)} versions, "
+                      f"{sum(entry.get('Size', 0) for entry in entries)} bytes")
+                return 0
+            expired = [{'Key': entry['Key'], 'VersionId': entry['VersionId']} for entry in entries]
+            deleted_count += delete_expired_versions(aws_s3_client, bucket_name, expired, concurrency)
         else:
             response = aws_s3_client.list_object_versions(Bucket=bucket_name)
             print(f"Checking versions for all files in bucket: {bucket_name}")
-            deleted_count += process_versions(aws_s3_client, bucket_name, response, cutoff_date)
+            # expired versions are collected across pages so that several
+            # full delete_objects batches go out together
+            pending = expired_versions(response, cutoff_date)
             
             while response.get('IsTruncated', False):
+                if len(pending) >= DELETE_BATCH_SIZE * concurrency:
+                    deleted_count += delete_expired_versions(aws_s3_client, bucket_name, pending, concurrency)
+                    pending = []
                 kwargs = {
                     'Bucket': bucket_name,
                     'KeyMarker': response.get('NextKeyMarker'),
                     'VersionIdMarker': response.get('NextVersionIdMarker')
                 }
                 response = aws_s3_client.list_object_versions(**kwargs)
-                deleted_count += process_versions(aws_s3_client, bucket_name, response, cutoff_date)
+                pending += expired_versions(response, cutoff_date)
+
+            deleted_count += delete_expired_versions(aws_s3_client, bucket_name, pending, concurrency)
                 
         print(f"Total versions deleted: {deleted_count}")
         return deleted_count
@@ -243,107 +629,321 @@ def check_and_delete_old_versions(aws_s3_client, bucket_name, file_key=None, mon
         print(f"Error checking/deleting versions: {e}")
         return deleted_count
 
-def process_versions(aws_s3_client, bucket_name, response, cutoff_date):
+def delete_old_versions_from_index(aws_s3_client, bucket_name, index_path, months=6, concurrency=4,
+                                   dry_run=False):
+    # answers "what is expired" from the local index instead of listing the bucket
+    from object.index import open_index, query_expired_versions, forget_versions
+
+    cutoff_date = version_cutoff(months)
+    print(f"Checking indexed versions older than {cutoff_date.strftime('%Y-%m-%d')}")
+
+    try:
+        with closing(open_index(index_path)) as connection:
+            rows = query_expired_versions(connection, bucket_name, cutoff_date)
+            expired = [{'Key': row['key'], 'VersionId': row['version_id']} for row in rows]
+            if dry_run:
+                print(f"Would delete {len(expired)} versions, {sum(row['size'] for row in rows)} bytes")
+                return 0
+
+            deleted_count, errors = delete_object_batches(aws_s3_client, bucket_name, expired, concurrency)
+            failed = set()
+            for key, version_id, error in errors:
+                print(f"Error deleting version {version_id} of {key}: {error}")
+                failed.add((key, version_id))
+            forget_versions(connection, bucket_name,
+                            [version for version in expired
+                             if (version['Key'], version['VersionId']) not in failed])
+        print(f"Total versions deleted: {deleted_count}")
+        return deleted_count
+    except Exception as e:
+        print(f"Error checking/deleting versions: {e}")
+        return 0
+
+
+DELETE_BATCH_SIZE = 1000
+
+
+def delete_object_batches(aws_s3_client, bucket_name, objects, concurrency=4, limiter=None):
+    # objects is [{'Key': ..., 'VersionId': ...}, ...]; sends delete_objects
+    # requests of up to 1000 keys, several at a time. Each key prefix in a
+    # batch is charged to its own token bucket. Throttled keys are re-queued
+    # split by prefix, so a busy prefix is paced on its own from then on.
+    # returns (deleted_count, [(key, version_id, error), ...])
+    from object.ratelimit import default_limiter, run_with_requeue, is_throttle_error, THROTTLE_CODES
+
+    limiter = limiter or default_limiter()
+    batches = [objects[i:i + DELETE_BATCH_SIZE] for i in range(0, len(objects), DELETE_BATCH_SIZE)]
+
+    def by_prefix(batch):
+        groups = {}
+        for obj in batch:
+            groups.setdefault(limiter.prefix(obj['Key']), []).append(obj)
+        return list(groups.values())
+
+    def delete_batch(batch):
+        groups = by_prefix(batch)
+        for group in groups:
+            limiter.acquire(bucket_name, group[0]['Key'], len(group))
+        try:
+            response = aws_s3_client.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': batch, 'Quiet': True}
+            )
+        except Exception as e:
+            if not is_throttle_error(e):
+                raise
+            # the reply does not say which prefix was busy, so all of them slow down
+            for group in groups:
+                limiter.throttled(bucket_name, group[0]['Key'])
+            return (0, [], len(batch)), groups
+        failed = []
+        throttled = []
+        for error in response.get('Errors', []):
+            if error.get('Code') in THROTTLE_CODES:
+                throttled.append({name: error[name] for name in ('Key', 'VersionId') if error.get(name)})
+            else:
+                failed.append((error['Key'], error.get('VersionId'), error.get('Message', error.get('Code'))))
+        throttled_groups = by_prefix(throttled)
+        throttled_prefixes = {limiter.prefix(group[0]['Key']) for group in throttled_groups}
+        for group in groups:
+            if limiter.prefix(group[0]['Key']) in throttled_prefixes:
+                limiter.throttled(bucket_name, group[0]['Key'])
+            else:
+                limiter.succeeded(bucket_name, group[0]['Key'])
+        return (len(batch) - len(failed) - len(throttled), failed, len(throttled)), throttled_groups
 
     deleted_count = 0
+    errors = []
 
-    if 'Versions' in response:
-        for version in response['Versions']:
-            key = version['Key']
-            version_id = version['VersionId']
-            last_modified = version['LastModified']
- 
-            if last_modified < cutoff_date:
-                try:
-                    print(f"Deleting old version of {key}, version: {version_id}, modified: {last_modified}")
-                    aws_s3_client.delete_object(
-                        Bucket=bucket_name,
-                        Key=key,
-                        VersionId=version_id
-                    )
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"Error deleting version {version_id} of {key}: {e}")
-
-    if 'DeleteMarkers' in response:
-        for marker in response['DeleteMarkers']:
-            key = marker['Key']
-            version_id = marker['VersionId']
-            last_modified = marker['LastModified']
-
-            if last_modified < cutoff_date:
-                try:
-                    print(f"Deleting old delete marker of {key}, version: {version_id}, modified: {last_modified}")
-                    aws_s3_client.delete_object(
-                        Bucket=bucket_name,
-                        Key=key,
-                        VersionId=version_id
-                    )
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"Error deleting delete marker {version_id} of {key}: {e}")
-    
+    def batch_done(batch, result):
+        nonlocal deleted_count, errors
+        deleted, failed, throttled = result
+        deleted_count += deleted
+        errors += failed
+        print(f"Deleted batch: {deleted} removed, {len(failed)} errors"
+              + (f", {throttled} throttled" if throttled else ""))
+
+    for batch, error in run_with_requeue(batches, delete_batch, concurrency, on_done=batch_done):
+        errors += [(obj['Key'], obj.get('VersionId'), str(error)) for obj in batch]
+    return deleted_count, errors
+
+
+def version_cutoff(months):
+    # versions last modified before this are expired; a month is 30 days
+    import datetime
+
+    return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30 * months)
+
+
+def expired_versions(response, cutoff_date):
+    expired = []
+    for version in response.get('Versions', []) + response.get('DeleteMarkers', []):
+        if version['LastModified'] < cutoff_date:
+            expired.append({'Key': version['Key'], 'VersionId': version['VersionId']})
+    return expired
+
+
+def delete_expired_versions(aws_s3_client, bucket_name, expired, concurrency=4):
+    if not expired:
+        return 0
+
+    print(f"Deleting {len(expired)} old versions and delete markers")
+    deleted_count, errors = delete_object_batches(aws_s3_client, bucket_name, expired, concurrency)
+    for key, version_id, error in errors:
+        print(f"Error deleting version {version_id} of {key}: {error}")
     return deleted_count
 
 
-def upload_folder_to_s3(aws_s3_client, folder_path, bucket_name):
+def process_versions(aws_s3_client, bucket_name, response, cutoff_date, concurrency=4):
+    return delete_expired_versions(aws_s3_client, bucket_name,
+                                   expired_versions(response, cutoff_date), concurrency)
+
+
+def collect_folder_files(folder_path):
     import os
     import mimetypes
-    
+
+    files_to_upload = []
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if file.startswith('.'):
+                continue
+
+            local_path = os.path.join(root, file)
+            relative_path = os.path.relpath(local_path, folder_path).replace(os.sep, '/')
+
+            content_type = mimetypes.guess_type(file)[0]
+            if content_type is None:
+                content_type = 'application/octet-stream'
+            files_to_upload.append((local_path, relative_path, content_type))
+    return files_to_upload
+
+
+def upload_files_concurrently(aws_s3_client, bucket_name, files_to_upload, concurrency=1, limiter=None):
+    # files_to_upload is [(local_path, key, content_type), ...]; every upload
+    # takes a token from its prefix's bucket and throttled files are
+    # re-queued instead of reported as failed.
+    # returns (uploaded_count, [(key, error), ...])
+    from object.ratelimit import default_limiter, run_with_requeue, is_throttle_error
+
+    limiter = limiter or default_limiter()
     uploaded_files = 0
-    errors = 0
-    
+
+    def upload_one(file_to_upload):
+        local_path, key, content_type = file_to_upload
+        limiter.acquire(bucket_name, key)
+        try:
+            aws_s3_client.upload_file(
+                Filename=local_path,
+                Bucket=bucket_name,
+                Key=key,
+                ExtraArgs={'ContentType': content_type}
+            )
+        except Exception as e:
+            if is_throttle_error(e):
+                limiter.throttled(bucket_name, key)
+            raise
+        limiter.succeeded(bucket_name, key)
+        return None, []
+
+    def file_done(file_to_upload, result):
+        nonlocal uploaded_files
+        print(f"Uploaded {file_to_upload[1]}")
+        uploaded_files += 1
+
+    errors = []
+    for (local_path, key, content_type), error in run_with_requeue(files_to_upload, upload_one,
+                                                                   concurrency, on_done=file_done):
+        print(f"Error uploading {key}: {error}")
+        errors.append((key, str(error)))
+    return uploaded_files, errors
+
+
+def print_upload_errors(errors):
+    if errors:
+        print("Failed files:")
+        for key, error in sorted(errors):
+            print(f"  {key}: {error}")
+
+
+def upload_folder_to_s3(aws_s3_client, folder_path, bucket_name, concurrency=1):
     try:
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                local_path = os.path.join(root, file)
-                relative_path = os.path.relpath(local_path, folder_path)
-
-                if file.startswith('.'):
-                    continue
-
-                content_type = mimetypes.guess_type(file)[0]
-                if content_type is None:
-                    content_type = 'application/octet-stream'
-                try:
-                    aws_s3_client.upload_file(
-                        Filename=local_path,
-                        Bucket=bucket_name,
-                        Key=relative_path,
-                        ExtraArgs={'ContentType': content_type}
-                    )
-                    print(f"Uploaded {relative_path}")
-                    uploaded_files += 1
-                except Exception as e:
-                    print(f"Error uploading {relative_path}: {e}")
-                    errors += 1
+        files_to_upload = collect_folder_files(folder_path)
+        uploaded_files, errors = upload_files_concurrently(
+            aws_s3_client, bucket_name, files_to_upload, concurrency
+        )
         
-        print(f"Upload summary: {uploaded_files} files uploaded, {errors} errors")
+        print(f"Upload summary: {uploaded_files} files uploaded, {len(errors)} errors")
+        print_upload_errors(errors)
         return uploaded_files > 0
     except Exception as e:
         print(f"Error uploading folder: {e}")
         return False
 
+def github_archive_url(repo_url, branch='main'):
+    from urllib.parse import urlparse
+
+    path_parts = urlparse(repo_url).path.strip('/').split('/')
+    if len(path_parts) < 2:
+        return None
+    owner, repo = path_parts[0], path_parts[1]
+    return f"https://github.com/{owner}/{repo}/archive/refs/heads/{branch}.zip"
+
+
+def upload_github_repo_to_s3(aws_s3_client, repo_url, bucket_name, concurrency=1):
+    # uploads the members of the branch archive straight from the zip,
+    # without extracting or copying it; the top-level "<repo>-<branch>/"
+    # directory is stripped from the keys
+    import mimetypes
+    import tempfile
+    import requests
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    zip_url = github_archive_url(repo_url)
+    if zip_url is None:
+        print("Invalid GitHub URL")
+        return False
+
+    try:
+        print(f"Downloading {zip_url}...")
+        response = requests.get(zip_url, stream=True)
+        if response.status_code != 200:
+            print(f"Failed to download repository: HTTP {response.status_code}")
+            return False
+
+        # zip needs random access to its central directory, so the archive
+        # itself is written to disk once. Not SpooledTemporaryFile: before
+        # Python 3.11 it has no seekable(), which zipfile needs to read members
+        with tempfile.TemporaryFile() as archive:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                archive.write(chunk)
+            archive.seek(0)
+
+            with zipfile.ZipFile(archive) as zip_ref:
+                members = []
+                for info in zip_ref.infolist():
+                    if info.is_dir():
+                        continue
+                    parts = info.filename.split('/', 1)
+                    if len(parts) < 2 or os.path.basename(parts[1]).startswith('.'):
+                        continue
+                    content_type = mimetypes.guess_type(parts[1])[0] or 'application/octet-stream'
+                    members.append((info, parts[1], content_type))
+
+                if not members:
+                    print("Empty archive downloaded")
+                    return False
+
+                def upload_member(info, key, content_type):
+                    # members are inflated while they are sent; zipfile
+                    # serialises reads of the shared archive internally
+                    with zip_ref.open(info) as member:
+                        aws_s3_client.upload_fileobj(
+                            Fileobj=member,
+                            Bucket=bucket_name,
+                            Key=key,
+                            ExtraArgs={'ContentType': content_type}
+                        )
+
+                uploaded_files = 0
+                errors = []
+                with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                    futures = {
+                        executor.submit(upload_member, info, key, content_type): key
+                        for info, key, content_type in members
+                    }
+                    for future in as_completed(futures):
+                        key = futures[future]
+                        try:
+                            future.result()
+                            print(f"Uploaded {key}")
+                            uploaded_files += 1
+                        except Exception as e:
+                            print(f"Error uploading {key}: {e}")
+                            errors.append((key, str(e)))
+
+        print(f"Upload summary: {uploaded_files} files uploaded, {len(errors)} errors")
+        print_upload_errors(errors)
+        return uploaded_files > 0
+    except Exception as e:
+        print(f"Error uploading repository: {e}")
+        return False
+
+
 def clone_github_repo(repo_url, target_dir):
     import os
     import shutil
     import tempfile
     import requests
     import zipfile
-    from urllib.parse import urlparse
     
-    parsed_url = urlparse(repo_url)
-    path_parts = parsed_url.path.strip('/').split('/')
-    
-    if len(path_parts) < 2:
+    zip_url = github_archive_url(repo_url)
+    if zip_url is None:
         print("Invalid GitHub URL")
         return False
     
-    owner, repo = path_parts[0], path_parts[1]
-    branch = 'main'  
-    
     try:
-        zip_url = f"https://github.com/{owner}/{repo}/archive/refs/heads/{branch}.zip"
         print(f"Downloading {zip_url}...")
         
         response = requests.get(zip_url, stream=True)
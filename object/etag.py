@@ -0,0 +1,108 @@
+#etag
+
+import math
+import os
+from hashlib import md5
+
+
+MIB = 1024 * 1024
+READ_CHUNK = 8 * MIB
+# boto3's upload_file switches to multipart at 8 MiB with 8 MiB parts,
+# upload_large_file picks 8-128 MiB parts from the file size (5 MiB before)
+COMMON_PART_SIZES = (8 * MIB, 5 * MIB, 16 * MIB, 32 * MIB, 64 * MIB, 128 * MIB)
+
+
+def normalize_etag(etag):
+    return etag.strip('"') if etag else etag
+
+
+def etag_part_count(etag):
+    # "abc-12" -> 12, plain md5 etags -> 0
+    etag = normalize_etag(etag)
+    if etag and '-' in etag:
+        return int(etag.rsplit('-', 1)[1])
+    return 0
+
+
+def md5_etag(file_path):
+    digest = md5()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def multipart_etag(file_path, part_size):
+    # md5 of the concatenated binary md5 of every part, suffixed with the part count
+    part_digests = []
+    with open(file_path, 'rb') as file:
+        for part in iter(lambda: file.read(part_size), b''):
+            part_digests.append(md5(part).digest())
+    if not part_digests:
+        part_digests.append(md5(b'').digest())
+    return f"{md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def compute_etag(file_path, part_size=None):
+    # part_size=None computes the single-put etag, otherwise the etag of a
+    # multipart upload split into part_size parts
+    if part_size:
+        return multipart_etag(file_path, part_size)
+    return md5_etag(file_path)
+
+
+def candidate_part_sizes(file_size, part_count, extra_part_sizes=()):
+    part_sizes = list(extra_part_sizes) + [size for size in COMMON_PART_SIZES if size not in extra_part_sizes]
+    return [part_size for part_size in part_sizes
+            if part_size and math.ceil(file_size / part_size) == part_count]
+
+
+def etag_matches(file_path, remote_etag, known_etags=None, extra_part_sizes=()):
+    # known_etags caches {str(part_size or 0): etag} between calls and is
+    # updated in place; extra_part_sizes are tried before the common ones
+    remote_etag = normalize_etag(remote_etag)
+    if known_etags is None:
+        known_etags = {}
+
+    part_count = etag_part_count(remote_etag)
+    if part_count:
+        part_sizes = candidate_part_sizes(os.path.getsize(file_path), part_count, extra_part_sizes)
+    else:
+        part_sizes = [0]
+
+    for part_size in part_sizes:
+        cache_key = str(part_size)
+        if cache_key not in known_etags:
+            known_etags[cache_key] = compute_etag(file_path, part_size or None)
+        if known_etags[cache_key] == remote_etag:
+            return True
+    return False
+
+
+def remote_object_info(aws_s3_client, bucket_name, key):
+    # {'Size', 'ETag'} of the current object, or None when it does not exist
+    from botocore.exceptions import ClientError
+
+    try:
+        head = aws_s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return {'Size': head['ContentLength'], 'ETag': head['ETag']}
+
+
+def is_unchanged(aws_s3_client, bucket_name, key, file_path, part_size=None, remote_objects=None):
+    # True when the object at key already holds exactly the bytes of file_path.
+    # remote_objects is an optional {key: {'Size', 'ETag'}} listing that
+    # replaces the head_object call. ETags of SSE-KMS objects are not md5
+    # based and never match, those files are always uploaded.
+    if remote_objects is not None:
+        remote = remote_objects.get(key)
+    else:
+        remote = remote_object_info(aws_s3_client, bucket_name, key)
+
+    if remote is None or remote['Size'] != os.path.getsize(file_path):
+        return False
+    extra_part_sizes = (part_size,) if part_size else ()
+    return etag_matches(file_path, remote['ETag'], extra_part_sizes=extra_part_sizes)
@@ -0,0 +1,198 @@
+#index
+
+import sqlite3
+import sys
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified REAL NOT NULL,
+    PRIMARY KEY (bucket, key)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified REAL NOT NULL,
+    is_latest INTEGER NOT NULL,
+    is_delete_marker INTEGER NOT NULL,
+    PRIMARY KEY (bucket, key, version_id)
+);
+CREATE INDEX IF NOT EXISTS versions_last_modified ON versions (bucket, last_modified);
+DROP TABLE IF EXISTS watermarks;
+CREATE TABLE IF NOT EXISTS prefix_watermarks (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    last_modified REAL NOT NULL,
+    PRIMARY KEY (bucket, prefix)
+);
+'''
+
+
+def open_index(index_path):
+    connection = sqlite3.connect(index_path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def prefix_upper_bound(prefix):
+    # smallest string above every key starting with prefix: the prefix with
+    # its last character incremented. Keys compare as UTF-8 bytes, which
+    # order like code points. None when every character is already the
+    # largest code point, so nothing bounds the range from above
+    while prefix:
+        code_point = ord(prefix[-1]) + 1
+        if code_point <= sys.maxunicode:
+            if 0xD800 <= code_point <= 0xDFFF:
+                # surrogates cannot be stored as UTF-8
+                code_point = 0xE000
+            return prefix[:-1] + chr(code_point)
+        prefix = prefix[:-1]
+    return None
+
+
+def prefix_filter(prefix):
+    # rows whose key starts with prefix, as a range on the (bucket, key)
+    # primary key so SQLite seeks to it instead of scanning the bucket
+    if not prefix:
+        return '', ()
+    upper = prefix_upper_bound(prefix)
+    if upper is None:
+        return ' AND key >= ?', (prefix,)
+    return ' AND key >= ? AND key < ?', (prefix, upper)
+
+
+def get_watermark(connection, bucket_name, prefix=''):
+    # newest LastModified seen by an earlier refresh that listed all of
+    # prefix: a refresh of prefix itself or of a prefix covering it
+    rows = connection.execute('SELECT prefix, last_modified FROM prefix_watermarks WHERE bucket = ?',
+                              (bucket_name,)).fetchall()
+    return max((row['last_modified'] for row in rows if prefix.startswith(row['prefix'])), default=0.0)
+
+
+def refresh_index(connection, aws_s3_client, bucket_name, prefixes=None, versions=True):
+    # re-lists the given prefixes (default: the whole bucket) and brings
+    # their rows up to date; unchanged rows are not rewritten. S3 cannot
+    # list by modification time, so the per-prefix watermark only tells
+    # callers what is new since that prefix was last refreshed.
+    # returns the number of objects newer than the watermarks
+    from object.crud import iter_object_pages
+
+    changed = 0
+
+    with connection:
+        for prefix in prefixes or ['']:
+            watermark = get_watermark(connection, bucket_name, prefix)
+            newest = watermark
+            where, params = prefix_filter(prefix)
+            seen = set()
+            for page in iter_object_pages(aws_s3_client, bucket_name, prefix):
+                rows = []
+                for obj in page.get('Contents', []):
+                    seen.add(obj['Key'])
+                    last_modified = obj['LastModified'].timestamp()
+                    newest = max(newest, last_modified)
+                    if last_modified > watermark:
+                        changed += 1
+                    rows.append((bucket_name, obj['Key'], obj['Size'], obj['ETag'], last_modified))
+                connection.executemany(
+                    'INSERT INTO objects VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (bucket, key) DO UPDATE SET size = excluded.size, '
+                    'etag = excluded.etag, last_modified = excluded.last_modified '
+                    'WHERE excluded.last_modified != objects.last_modified OR excluded.etag != objects.etag',
+                    rows
+                )
+            stale = [
+                (bucket_name, row['key'])
+                for row in connection.execute('SELECT key FROM objects WHERE bucket = ?' + where,
+                                              (bucket_name,) + params)
+                if row['key'] not in seen
+            ]
+            connection.executemany('DELETE FROM objects WHERE bucket = ? AND key = ?', stale)
+
+            if versions:
+                # versions never change once written, only which one is latest
+                seen = set()
+                paginator = aws_s3_client.get_paginator('list_object_versions')
+                for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                    rows = [
+                        (bucket_name, version['Key'], version['VersionId'], version.get('Size', 0),
+                         version.get('ETag'), version['LastModified'].timestamp(),
+                         int(version.get('IsLatest', False)), int(is_marker))
+                        for entries, is_marker in ((page.get('Versions', []), False),
+                                                   (page.get('DeleteMarkers', []), True))
+                        for version in entries
+                    ]
+                    seen.update((row[1], row[2]) for row in rows)
+                    connection.executemany(
+                        'INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                        'ON CONFLICT (bucket, key, version_id) DO UPDATE SET is_latest = excluded.is_latest '
+                        'WHERE excluded.is_latest != versions.is_latest',
+                        rows
+                    )
+                stale = [
+                    (bucket_name, row['key'], row['version_id'])
+                    for row in connection.execute('SELECT key, version_id FROM versions WHERE bucket = ?' + where,
+                                                  (bucket_name,) + params)
+                    if (row['key'], row['version_id']) not in seen
+                ]
+                connection.executemany('DELETE FROM versions WHERE bucket = ? AND key = ? AND version_id = ?',
+                                       stale)
+
+            connection.execute(
+                'INSERT INTO prefix_watermarks VALUES (?, ?, ?) '
+                'ON CONFLICT (bucket, prefix) DO UPDATE SET last_modified = excluded.last_modified',
+                (bucket_name, prefix, newest)
+            )
+    return changed
+
+
+def query_objects(connection, bucket_name, prefix=''):
+    where, params = prefix_filter(prefix)
+    return connection.execute(
+        'SELECT key, size, etag, last_modified FROM objects WHERE bucket = ?' + where + ' ORDER BY key',
+        (bucket_name,) + params
+    ).fetchall()
+
+
+def query_versions(connection, bucket_name, file_key):
+    # exact-key history, newest first; LastModified has one-second
+    # resolution, so the latest version breaks ties
+    return connection.execute(
+        'SELECT key, version_id, size, last_modified, is_latest, is_delete_marker FROM versions '
+        'WHERE bucket = ? AND key = ? ORDER BY last_modified DESC, is_latest DESC',
+        (bucket_name, file_key)
+    ).fetchall()
+
+
+def query_expired_versions(connection, bucket_name, cutoff_date, prefix=''):
+    where, params = prefix_filter(prefix)
+    return connection.execute(
+        'SELECT key, version_id, size, is_delete_marker FROM versions '
+        'WHERE bucket = ? AND last_modified < ?' + where,
+        (bucket_name, cutoff_date.timestamp()) + params
+    ).fetchall()
+
+
+def forget_versions(connection, bucket_name, versions):
+    # versions is [{'Key': ..., 'VersionId': ...}, ...]; keys that lost their
+    # latest version are dropped from objects until the next refresh
+    params = [(bucket_name, version['Key'], version['VersionId']) for version in versions]
+    with connection:
+        connection.executemany(
+            'DELETE FROM objects WHERE bucket = ? AND key = ? AND EXISTS ('
+            'SELECT 1 FROM versions WHERE versions.bucket = objects.bucket AND versions.key = objects.key '
+            'AND versions.version_id = ? AND versions.is_latest = 1)',
+            params
+        )
+        connection.executemany(
+            'DELETE FROM versions WHERE bucket = ? AND key = ? AND version_id = ?',
+            params
+        )
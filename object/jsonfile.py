@@ -0,0 +1,24 @@
+#jsonfile
+
+# small JSON state files: upload journals, sync manifests and cleanup
+# checkpoints
+
+import json
+import os
+
+
+def load_json_file(path):
+    # None when the file is missing or unreadable
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json_file(path, data):
+    # write to a temp file first so a crash never leaves a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_path, path)
@@ -0,0 +1,70 @@
+#mime
+
+import mimetypes
+import threading
+
+
+# extension guesses that say nothing about the content, sniff these instead
+AMBIGUOUS_TYPES = {None, 'application/octet-stream', 'text/plain', 'application/x-msdownload'}
+DEFAULT_TYPE = 'application/octet-stream'
+PROCESS_POOL_THRESHOLD = 2000
+
+_local = threading.local()
+_magic_missing_reported = False
+
+
+def get_mime_detector():
+    # libmagic handles are not thread safe, keep one per thread (and so one
+    # per worker process); returns None when python-magic is not installed
+    global _magic_missing_reported
+    if not hasattr(_local, 'detector'):
+        try:
+            import magic
+            _local.detector = magic.Magic(mime=True)
+        except ImportError:
+            if not _magic_missing_reported:
+                print("python-magic is not installed, falling back to extension based MIME types")
+                _magic_missing_reported = True
+            _local.detector = None
+    return _local.detector
+
+
+def sniff_mime_type(file_path):
+    detector = get_mime_detector()
+    if detector is None:
+        return mimetypes.guess_type(file_path)[0] or DEFAULT_TYPE
+    return detector.from_file(file_path)
+
+
+def guess_mime_type(file_path):
+    # fast path: trust the extension unless it is missing or too generic
+    guessed = mimetypes.guess_type(file_path)[0]
+    if guessed in AMBIGUOUS_TYPES:
+        return None
+    return guessed
+
+
+def classify_files(file_paths, processes=None):
+    # {file_path: mime_type}; ambiguous files are sniffed with libmagic,
+    # in a process pool once there are enough of them to pay for it
+    from concurrent.futures import ProcessPoolExecutor
+
+    mime_types = {}
+    ambiguous = []
+    for file_path in file_paths:
+        guessed = guess_mime_type(file_path)
+        if guessed:
+            mime_types[file_path] = guessed
+        else:
+            ambiguous.append(file_path)
+
+    if len(ambiguous) >= PROCESS_POOL_THRESHOLD and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            sniffed = executor.map(sniff_mime_type, ambiguous, chunksize=256)
+            mime_types.update(zip(ambiguous, sniffed))
+    else:
+        for file_path in ambiguous:
+            mime_types[file_path] = sniff_mime_type(file_path)
+
+    print(f"Classified {len(mime_types)} files, {len(ambiguous)} needed content sniffing")
+    return mime_types
@@ -0,0 +1,367 @@
+#multipart
+
+import math
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+MIB = 1024 * 1024
+MIN_PART_SIZE = 5 * MIB
+DEFAULT_PART_SIZE = 5 * MIB
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+MAX_PARTS = 10000
+# copy_object handles sources up to 5 GiB, bigger ones need upload_part_copy
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * MIB
+DEFAULT_COPY_PART_SIZE = 256 * MIB
+DEFAULT_RANGE_SIZE = 16 * MIB
+
+
+def plan_parts(file_size, part_size=DEFAULT_PART_SIZE):
+    # returns [(part_number, offset, length), ...] covering the whole file
+    if file_size == 0:
+        return [(1, 0, 0)]
+
+    part_count = math.ceil(file_size / part_size)
+    parts = []
+    for i in range(part_count):
+        offset = i * part_size
+        parts.append((i + 1, offset, min(part_size, file_size - offset)))
+    return parts
+
+
+class FilePartSource:
+    # reads every part into a fresh bytes object; each call opens its own
+    # handle so parts never share a file position
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def read(self, offset, length):
+        with open(self.file_path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+    def release(self, offset, length):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryviewReader:
+    # file-like view over a memoryview slice; botocore and the HTTP layer
+    # pull the body in small chunks, so only those chunks are ever copied
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            end = len(self._view)
+        else:
+            end = min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, min(offset, len(self._view)))
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+
+class MmapPartSource:
+    # maps the file once and hands out zero-copy memoryview slices per part;
+    # the mapping is shared by all workers
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def read(self, offset, length):
+        return MemoryviewReader(self._view[offset:offset + length])
+
+    def release(self, offset, length):
+        # drop the sent pages from this process; they stay in the page cache
+        if length and hasattr(mmap, 'MADV_DONTNEED'):
+            start = offset - offset % mmap.PAGESIZE
+            self._mmap.madvise(mmap.MADV_DONTNEED, start, offset + length - start)
+
+    def close(self):
+        self._file.close()
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # a failed request's traceback can still hold a part's slice;
+            # the mapping is then unmapped once that reference is dropped
+            pass
+
+
+def open_part_source(file_path, use_mmap=True):
+    # empty files cannot be mapped, fall back to plain reads for them
+    if use_mmap and os.path.getsize(file_path) > 0:
+        return MmapPartSource(file_path)
+    return FilePartSource(file_path)
+
+
+def call_with_retry(fn, label, max_retries=DEFAULT_MAX_RETRIES, on_error=None):
+    # calls fn() until it returns, waiting 0.5s, 1s, 2s, ... between
+    # attempts; on_error(exception) sees every failed attempt and label
+    # names the work in the retry message
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if on_error:
+                on_error(e)
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = 0.5 * 2 ** (attempt - 1)
+            print(f"{label} failed ({e}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_parts(fn, parts, concurrency=DEFAULT_CONCURRENCY, on_done=None):
+    # runs fn(*part) for every part on a pool of `concurrency` threads and
+    # calls on_done(result, finished_count) from this thread as parts finish.
+    # The first failure cancels the parts not started yet; parts already
+    # running are waited for and still reported to on_done, so a journal
+    # keeps them, before the failure is raised.
+    # returns the results in completion order
+    results = []
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(fn, *part) for part in parts]
+        try:
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                        for pending in futures:
+                            pending.cancel()
+                    continue
+                results.append(result)
+                if on_done:
+                    on_done(result, len(results))
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    if error is not None:
+        raise error
+    return results
+
+
+def upload_part_with_retry(aws_s3_client, bucket_name, object_name, upload_id,
+                           part_source, part_number, offset, length,
+                           max_retries=DEFAULT_MAX_RETRIES, on_error=None, on_success=None):
+    # on_error(exception) sees every failed attempt, on_success(response)
+    # the upload_part response of the one that worked
+    def upload():
+        data = part_source.read(offset, length)
+        response = aws_s3_client.upload_part(
+            Body=data,
+            Bucket=bucket_name,
+            Key=object_name,
+            PartNumber=part_number,
+            UploadId=upload_id
+        )
+        part_source.release(offset, length)
+        return response
+
+    response = call_with_retry(upload, f"Part {part_number}", max_retries, on_error)
+    if on_success:
+        on_success(response)
+    return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+
+def upload_parts_concurrently(aws_s3_client, part_source, bucket_name, object_name,
+                              upload_id, parts, concurrency=DEFAULT_CONCURRENCY,
+                              max_retries=DEFAULT_MAX_RETRIES, on_part_done=None):
+    # parts is the output of plan_parts(); returns the sorted part list
+    # expected by complete_multipart_upload. on_part_done is called from
+    # the calling thread after every finished part.
+    def upload(part_number, offset, length):
+        return upload_part_with_retry(aws_s3_client, bucket_name, object_name, upload_id,
+                                      part_source, part_number, offset, length, max_retries)
+
+    def part_done(part, finished):
+        if on_part_done:
+            on_part_done(part)
+        print(f"Uploaded part {finished}/{len(parts)}")
+
+    completed = run_parts(upload, parts, concurrency, part_done)
+    return sorted(completed, key=lambda part: part['PartNumber'])
+
+
+def copy_part_size(object_size, part_size=DEFAULT_COPY_PART_SIZE):
+    # grow the part size when the default would exceed the part limit
+    return max(part_size, math.ceil(object_size / MAX_PARTS))
+
+
+def copy_part_with_retry(aws_s3_client, bucket_name, object_name, upload_id, copy_source,
+                         part_number, offset, length, max_retries=DEFAULT_MAX_RETRIES):
+    def copy():
+        return aws_s3_client.upload_part_copy(
+            Bucket=bucket_name,
+            Key=object_name,
+            CopySource=copy_source,
+            CopySourceRange=f"bytes={offset}-{offset + length - 1}",
+            PartNumber=part_number,
+            UploadId=upload_id
+        )
+
+    response = call_with_retry(copy, f"Copy of part {part_number}", max_retries)
+    return {'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']}
+
+
+def copy_object_multipart(aws_s3_client, bucket_name, object_name, copy_source, object_size,
+                          part_size=DEFAULT_COPY_PART_SIZE, concurrency=DEFAULT_CONCURRENCY,
+                          max_retries=DEFAULT_MAX_RETRIES, extra_args=None):
+    # server-side copy through upload_part_copy; no object bytes pass
+    # through this process
+    parts_plan = plan_parts(object_size, copy_part_size(object_size, part_size))
+    mpu = aws_s3_client.create_multipart_upload(Bucket=bucket_name, Key=object_name, **(extra_args or {}))
+    upload_id = mpu['UploadId']
+
+    def copy(part_number, offset, length):
+        return copy_part_with_retry(aws_s3_client, bucket_name, object_name, upload_id, copy_source,
+                                    part_number, offset, length, max_retries)
+
+    try:
+        completed = run_parts(copy, parts_plan, concurrency,
+                              lambda part, finished: print(f"Copied part {finished}/{len(parts_plan)}"))
+        completed.sort(key=lambda part: part['PartNumber'])
+        return aws_s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=object_name,
+            MultipartUpload={'Parts': completed},
+            UploadId=upload_id
+        )
+    except Exception:
+        aws_s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_name, UploadId=upload_id)
+        raise
+
+
+DOWNLOAD_CHUNK = MIB
+
+
+def write_at(file_descriptor, data, offset):
+    # positional write, so ranges never contend on a shared file position
+    while data:
+        written = os.pwrite(file_descriptor, data, offset)
+        data = data[written:]
+        offset += written
+
+
+def download_range_with_retry(aws_s3_client, bucket_name, object_name, etag, file_descriptor,
+                              part_number, offset, length, max_retries=DEFAULT_MAX_RETRIES):
+    def download():
+        response = aws_s3_client.get_object(
+            Bucket=bucket_name,
+            Key=object_name,
+            Range=f"bytes={offset}-{offset + length - 1}",
+            IfMatch=etag
+        )
+        position = offset
+        for chunk in response['Body'].iter_chunks(DOWNLOAD_CHUNK):
+            write_at(file_descriptor, chunk, position)
+            position += len(chunk)
+        if position != offset + length:
+            raise IOError(f"range {part_number} ended after {position - offset} of {length} bytes")
+        return part_number
+
+    return call_with_retry(download, f"Range {part_number}", max_retries)
+
+
+def download_ranges_concurrently(aws_s3_client, bucket_name, object_name, etag, file_descriptor,
+                                 ranges, concurrency=DEFAULT_CONCURRENCY,
+                                 max_retries=DEFAULT_MAX_RETRIES):
+    # ranges is the output of plan_parts() for the object size
+    ranges = [part for part in ranges if part[2]]
+
+    def download(part_number, offset, length):
+        return download_range_with_retry(aws_s3_client, bucket_name, object_name, etag, file_descriptor,
+                                         part_number, offset, length, max_retries)
+
+    run_parts(download, ranges, concurrency,
+              lambda part_number, finished: print(f"Downloaded range {finished}/{len(ranges)}"))
+
+
+def journal_path_for(file_path):
+    return f"{file_path}.upload.json"
+
+
+def remove_journal(journal_path):
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
+
+def new_journal(file_path, bucket_name, object_name, upload_id, part_size):
+    stat = os.stat(file_path)
+    return {
+        'Bucket': bucket_name,
+        'Key': object_name,
+        'UploadId': upload_id,
+        'PartSize': part_size,
+        'FileSize': stat.st_size,
+        'FileMtime': stat.st_mtime,
+        'Parts': {}
+    }
+
+
+def journal_matches(journal, file_path, bucket_name, object_name):
+    stat = os.stat(file_path)
+    return (journal.get('Bucket') == bucket_name
+            and journal.get('Key') == object_name
+            and journal.get('FileSize') == stat.st_size
+            and journal.get('FileMtime') == stat.st_mtime)
+
+
+def list_uploaded_parts(aws_s3_client, bucket_name, object_name, upload_id):
+    # returns {part_number: etag} for every part S3 already holds
+    uploaded = {}
+    paginator = aws_s3_client.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket_name, Key=object_name, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            uploaded[part['PartNumber']] = part['ETag']
+    return uploaded
+
+
+def verified_parts(journal, uploaded):
+    # only trust parts that both the journal and S3 agree on
+    verified = {}
+    for part_number, etag in journal['Parts'].items():
+        if uploaded.get(int(part_number)) == etag:
+            verified[int(part_number)] = etag
+    return verified
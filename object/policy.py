@@ -1,8 +1,8 @@
 
 
-def set_object_access_policy(aws_s3_client, bucket_name, file_name):
+def set_object_access_policy(aws_s3_client, bucket_name, file_name, acl="public-read"):
     response = aws_s3_client.put_object_acl(
-        ACL="public-read",
+        ACL=acl,
         Bucket=bucket_name,
         Key=file_name
     )
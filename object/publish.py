@@ -0,0 +1,114 @@
+#publish
+
+import fnmatch
+import gzip
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from object.crud import collect_folder_files, print_upload_errors
+
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/javascript', 'application/javascript',
+    'application/json', 'image/svg+xml', 'text/plain', 'application/xml', 'text/xml',
+}
+# compressed copies that do not save at least this much are sent raw
+MIN_SAVING = 0.1
+
+# names like app.3f2a9c1b.js or main-8d7f6e5a4b3c.css never change content
+HASHED_ASSET = re.compile(r'[.-][0-9a-f]{8,}\.[^./]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# (pattern, Cache-Control) checked in order; patterns match the object key
+DEFAULT_CACHE_RULES = [
+    ('*.html', 'no-cache'),
+    ('*.json', 'no-cache'),
+    ('*', 'public, max-age=3600'),
+]
+
+
+def cache_control_for(key, rules=None):
+    if HASHED_ASSET.search(key):
+        return IMMUTABLE
+    for pattern, value in rules or DEFAULT_CACHE_RULES:
+        if fnmatch.fnmatch(key, pattern):
+            return value
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(data)
+    # mtime=0 keeps the output, and so the ETag, stable between deploys
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def resolve_encoding(encoding):
+    if encoding == 'br':
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            print("brotli is not installed, compressing with gzip instead")
+            return 'gzip'
+    return encoding
+
+
+def publish_file(aws_s3_client, bucket_name, local_path, key, content_type, encoding, cache_rules):
+    extra_args = {'ContentType': content_type}
+    cache_control = cache_control_for(key, cache_rules)
+    if cache_control:
+        extra_args['CacheControl'] = cache_control
+
+    if encoding and content_type.split(';')[0] in COMPRESSIBLE_TYPES:
+        with open(local_path, 'rb') as file:
+            data = file.read()
+        compressed = compress(data, encoding)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            aws_s3_client.put_object(Bucket=bucket_name, Key=key, Body=compressed,
+                                     ContentEncoding=encoding, **extra_args)
+            return len(data), len(compressed)
+
+    aws_s3_client.upload_file(Filename=local_path, Bucket=bucket_name, Key=key, ExtraArgs=extra_args)
+    size = os.path.getsize(local_path)
+    return size, size
+
+
+def publish_folder_to_s3(aws_s3_client, folder_path, bucket_name, concurrency=1,
+                         encoding='gzip', cache_rules=None):
+    # uploads a site with compressed text assets and Cache-Control headers.
+    # S3 website endpoints do not negotiate encodings, every client gets the
+    # stored copy, so brotli is only safe behind a CDN that handles it
+    encoding = resolve_encoding(encoding) if encoding else None
+    published = 0
+    raw_bytes = 0
+    sent_bytes = 0
+    errors = []
+
+    try:
+        files_to_publish = collect_folder_files(folder_path)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {
+                executor.submit(publish_file, aws_s3_client, bucket_name, local_path, key,
+                                content_type, encoding, cache_rules): key
+                for local_path, key, content_type in files_to_publish
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    original, sent = future.result()
+                    raw_bytes += original
+                    sent_bytes += sent
+                    published += 1
+                    print(f"Published {key} ({original} -> {sent} bytes)")
+                except Exception as e:
+                    print(f"Error publishing {key}: {e}")
+                    errors.append((key, str(e)))
+
+        print(f"Publish summary: {published} files, {raw_bytes} bytes reduced to {sent_bytes}, "
+              f"{len(errors)} errors")
+        print_upload_errors(errors)
+        return published > 0
+    except Exception as e:
+        print(f"Error publishing folder: {e}")
+        return False
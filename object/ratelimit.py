@@ -0,0 +1,169 @@
+#ratelimit
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# S3 scales request rates per key prefix: about 3,500 PUT/COPY/POST/DELETE
+# requests per second each, and it answers 503 SlowDown while a busy prefix
+# is being split across more capacity
+WRITE_RATE_PER_PREFIX = 3500
+MIN_RATE = 10
+THROTTLE_INTERVAL = 1.0
+# error codes S3 answers while it is overloaded, all safe to retry later;
+# per-key DeleteObjects errors use the same codes
+THROTTLE_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                  'TooManyRequestsException', 'ServiceUnavailable', 'InternalError', '503'}
+MAX_ROUNDS = 8
+BASE_DELAY = 0.5
+MAX_DELAY = 20.0
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def is_throttle_error(error):
+    # s3transfer wraps the ClientError (S3UploadFailedError), so the chain
+    # of causes is checked as well
+    while error is not None:
+        response = getattr(error, 'response', None) or {}
+        code = response.get('Error', {}).get('Code')
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if code in THROTTLE_CODES or status == 503:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def backoff_delay(round_number):
+    # full jitter, so re-queued work from many threads does not arrive together
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** round_number))
+
+
+class TokenBucket:
+    # `rate` tokens per second, holding at most `capacity`. The rate halves on
+    # a throttle, at most once per second so a burst of replies to requests
+    # sent together counts once, and creeps back up by a hundredth of
+    # max_rate per success.
+
+    def __init__(self, rate, capacity=None, min_rate=MIN_RATE):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._last_throttle = None
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self._lock:
+            self._refill()
+            self._tokens = 0
+            if self._last_throttle is not None and self._updated - self._last_throttle < THROTTLE_INTERVAL:
+                return
+            self._last_throttle = self._updated
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+class PrefixRateLimiter:
+    # one TokenBucket per (bucket, key prefix); the prefix is the key up to
+    # its `depth`-th '/', which is how most buckets spread their load
+
+    def __init__(self, rate=WRITE_RATE_PER_PREFIX, depth=1):
+        self.rate = rate
+        self.depth = depth
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def prefix(self, key):
+        parts = key.split('/', self.depth)
+        return '/'.join(parts[:self.depth]) if len(parts) > self.depth else ''
+
+    def bucket_for(self, bucket_name, key):
+        name = (bucket_name, self.prefix(key))
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = TokenBucket(self.rate)
+            return self._buckets[name]
+
+    def acquire(self, bucket_name, key, tokens=1):
+        self.bucket_for(bucket_name, key).acquire(tokens)
+
+    def throttled(self, bucket_name, key):
+        self.bucket_for(bucket_name, key).throttled()
+
+    def succeeded(self, bucket_name, key):
+        self.bucket_for(bucket_name, key).succeeded()
+
+
+def default_limiter():
+    # shared by every bulk job in the process, so concurrent jobs writing to
+    # the same prefix slow down together
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = PrefixRateLimiter()
+        return _default_limiter
+
+
+def run_with_requeue(items, operation, concurrency=4, on_done=None, max_rounds=MAX_ROUNDS):
+    # operation(item) returns (result, items_to_retry); raising a throttle
+    # error re-queues the whole item. Re-queued items run again after a
+    # jittered backoff, up to max_rounds in total. on_done(item, result) is
+    # called from this thread. returns [(item, error), ...] for items that
+    # failed with another error or were still throttled after the last round
+    failures = []
+    pending = list(items)
+
+    for round_number in range(max_rounds):
+        if not pending:
+            break
+        if round_number:
+            delay = backoff_delay(round_number)
+            print(f"Throttled, re-queuing {len(pending)} items in {delay:.1f}s")
+            time.sleep(delay)
+
+        retry = []
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(operation, item): item for item in pending}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    result, retry_items = future.result()
+                except Exception as e:
+                    if is_throttle_error(e):
+                        retry.append(item)
+                    else:
+                        failures.append((item, e))
+                    continue
+                retry += retry_items
+                if on_done:
+                    on_done(item, result)
+        pending = retry
+
+    failures += [(item, RuntimeError(f"still throttled after {max_rounds} attempts")) for item in pending]
+    return failures
@@ -0,0 +1,109 @@
+#sync
+
+import os
+
+from object.crud import (collect_folder_files, upload_files_concurrently, print_upload_errors,
+                         iter_objects, delete_object_batches)
+from object.etag import etag_matches
+from object.jsonfile import load_json_file, save_json_file
+
+
+MANIFEST_NAME = '.s3sync.json'
+
+
+def list_remote_objects(aws_s3_client, bucket_name, prefix=''):
+    # one paginated pass over the bucket: {key: {'Size', 'ETag', 'LastModified'}}
+    remote = {}
+    for obj in iter_objects(aws_s3_client, bucket_name, prefix):
+        remote[obj['Key']] = {
+            'Size': obj['Size'],
+            'ETag': obj['ETag'],
+            'LastModified': obj['LastModified']
+        }
+    return remote
+
+
+def load_manifest(manifest_path, bucket_name):
+    manifest = load_json_file(manifest_path)
+    if isinstance(manifest, dict) and manifest.get('bucket') == bucket_name:
+        return manifest
+    return {'bucket': bucket_name, 'files': {}}
+
+
+def cached_etags(manifest, key, stat):
+    # reuse hashes from the last run while size and mtime are unchanged
+    entry = manifest['files'].get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        return entry['etags']
+    etags = {}
+    manifest['files'][key] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'etags': etags}
+    return etags
+
+
+def needs_upload(local_path, key, remote, manifest, check_etag=True):
+    remote_object = remote.get(key)
+    if remote_object is None:
+        return True
+
+    stat = os.stat(local_path)
+    if stat.st_size != remote_object['Size']:
+        return True
+
+    if not check_etag:
+        return stat.st_mtime > remote_object['LastModified'].timestamp()
+
+    known_etags = cached_etags(manifest, key, stat)
+    return not etag_matches(local_path, remote_object['ETag'], known_etags)
+
+
+def delete_remote_keys(aws_s3_client, bucket_name, keys):
+    deleted, errors = delete_object_batches(aws_s3_client, bucket_name, [{'Key': key} for key in keys])
+    return deleted, [(key, error) for key, _, error in errors]
+
+
+def sync_folder_to_s3(aws_s3_client, folder_path, bucket_name, concurrency=1,
+                      delete=False, check_etag=True, manifest_path=None):
+    # upload only new or changed files; with delete=True also remove remote
+    # keys that no longer exist locally
+    if manifest_path is None:
+        manifest_path = os.path.join(folder_path, MANIFEST_NAME)
+
+    try:
+        remote = list_remote_objects(aws_s3_client, bucket_name)
+        manifest = load_manifest(manifest_path, bucket_name)
+        local_files = collect_folder_files(folder_path)
+        local_keys = {key for _, key, _ in local_files}
+
+        changed = [
+            (local_path, key, content_type)
+            for local_path, key, content_type in local_files
+            if needs_upload(local_path, key, remote, manifest, check_etag)
+        ]
+        print(f"Sync: {len(local_files)} local files, {len(remote)} remote objects, {len(changed)} to upload")
+
+        uploaded_files, errors = upload_files_concurrently(
+            aws_s3_client, bucket_name, changed, concurrency
+        )
+
+        deleted_files = 0
+        if delete:
+            stale_keys = sorted(key for key in remote if key not in local_keys)
+            if stale_keys:
+                deleted_files, delete_errors = delete_remote_keys(aws_s3_client, bucket_name, stale_keys)
+                errors += delete_errors
+
+        manifest['files'] = {key: entry for key, entry in manifest['files'].items() if key in local_keys}
+        try:
+            save_json_file(manifest_path, manifest)
+        except OSError as e:
+            # the manifest only caches hashes, so a read-only source folder
+            # makes the next sync slower, not wrong
+            print(f"Warning: could not save sync manifest {manifest_path}: {e}")
+
+        print(f"Sync summary: {uploaded_files} uploaded, {len(local_files) - len(changed)} unchanged, "
+              f"{deleted_files} deleted, {len(errors)} errors")
+        print_upload_errors(errors)
+        return not errors
+    except Exception as e:
+        print(f"Error syncing folder: {e}")
+        return False
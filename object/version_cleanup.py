@@ -0,0 +1,148 @@
+#version cleanup
+
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from object.crud import expired_versions, delete_object_batches, version_cutoff
+from object.jsonfile import load_json_file, save_json_file
+
+
+ROOT_SHARD = ''
+
+
+def list_version_shards(aws_s3_client, bucket_name, delimiter='/'):
+    # top-level common prefixes of the version listing, plus the root shard
+    # holding versions of keys that have no delimiter
+    shards = [ROOT_SHARD]
+    paginator = aws_s3_client.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket_name, Delimiter=delimiter):
+        shards += [common['Prefix'] for common in page.get('CommonPrefixes', [])]
+    return shards
+
+
+def load_checkpoint(checkpoint_path, bucket_name, dry_run):
+    checkpoint = load_json_file(checkpoint_path) if checkpoint_path else None
+    if isinstance(checkpoint, dict) and checkpoint.get('bucket') == bucket_name \
+            and checkpoint.get('dry_run') == dry_run:
+        return checkpoint
+    return {'bucket': bucket_name, 'dry_run': dry_run, 'cutoff': None, 'shards': {}}
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    if checkpoint_path:
+        save_json_file(checkpoint_path, checkpoint)
+
+
+def new_shard_state():
+    return {'KeyMarker': None, 'VersionIdMarker': None, 'done': False,
+            'expired': 0, 'bytes': 0, 'deleted': 0, 'errors': 0}
+
+
+def scan_shard(aws_s3_client, bucket_name, shard, delimiter, cutoff_date, state,
+               dry_run, commit):
+    # walks one shard from its saved markers; markers only advance after the
+    # page's expired versions were deleted, so a resumed run never skips any
+    while not state['done']:
+        kwargs = {'Bucket': bucket_name, 'Prefix': shard}
+        if shard == ROOT_SHARD:
+            kwargs['Delimiter'] = delimiter
+        if state['KeyMarker']:
+            kwargs['KeyMarker'] = state['KeyMarker']
+            kwargs['VersionIdMarker'] = state['VersionIdMarker']
+        response = aws_s3_client.list_object_versions(**kwargs)
+
+        expired = expired_versions(response, cutoff_date)
+        page = {
+            'expired': len(expired),
+            'bytes': sum(version.get('Size', 0) for version in response.get('Versions', [])
+                         if version['LastModified'] < cutoff_date),
+            'deleted': 0,
+            'errors': 0
+        }
+        if expired and not dry_run:
+            deleted, errors = delete_object_batches(aws_s3_client, bucket_name, expired, concurrency=1)
+            page['deleted'] = deleted
+            page['errors'] = len(errors)
+            for key, version_id, error in errors:
+                print(f"Error deleting version {version_id} of {key}: {error}")
+
+        if response.get('IsTruncated', False):
+            markers = {'KeyMarker': response.get('NextKeyMarker'),
+                       'VersionIdMarker': response.get('NextVersionIdMarker')}
+        else:
+            markers = {'done': True}
+        commit(state, page, markers)
+    return state
+
+
+def print_dry_run_report(shards):
+    print(f"{'prefix':<40} {'versions':>10} {'bytes':>16}")
+    total_expired = 0
+    total_bytes = 0
+    for shard, state in sorted(shards.items()):
+        print(f"{shard or '(root)':<40} {state['expired']:>10} {state['bytes']:>16}")
+        total_expired += state['expired']
+        total_bytes += state['bytes']
+    print(f"{'total':<40} {total_expired:>10} {total_bytes:>16}")
+
+
+def cleanup_old_versions_sharded(aws_s3_client, bucket_name, months=6, concurrency=4,
+                                 checkpoint_path=None, dry_run=False, delimiter='/'):
+    # returns the number of deleted versions; with dry_run nothing is deleted
+    # and the versions and bytes that would be freed are reported per prefix
+    checkpoint = load_checkpoint(checkpoint_path, bucket_name, dry_run)
+    if checkpoint['cutoff']:
+        cutoff_date = datetime.datetime.fromisoformat(checkpoint['cutoff'])
+        print(f"Resuming from checkpoint {checkpoint_path}")
+    else:
+        cutoff_date = version_cutoff(months)
+        checkpoint['cutoff'] = cutoff_date.isoformat()
+
+    print(f"Checking for versions older than {cutoff_date.strftime('%Y-%m-%d')}")
+
+    if not checkpoint['shards']:
+        for shard in list_version_shards(aws_s3_client, bucket_name, delimiter):
+            checkpoint['shards'][shard] = new_shard_state()
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    shards = checkpoint['shards']
+    pending = [shard for shard, state in shards.items() if not state['done']]
+    print(f"Scanning {len(pending)} of {len(shards)} prefixes with {concurrency} workers")
+
+    lock = threading.Lock()
+
+    def commit(state, page, markers):
+        # counters and markers of a page are applied together, so a saved
+        # checkpoint never counts a page it will scan again
+        with lock:
+            for name, value in page.items():
+                state[name] += value
+            state.update(markers)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(scan_shard, aws_s3_client, bucket_name, shard, delimiter,
+                            cutoff_date, shards[shard], dry_run, commit): shard
+            for shard in pending
+        }
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                state = future.result()
+                print(f"Finished {shard or '(root)'}: {state['expired']} old versions")
+            except Exception as e:
+                print(f"Error scanning {shard or '(root)'}: {e}")
+
+    if dry_run:
+        print_dry_run_report(shards)
+        deleted_count = 0
+    else:
+        deleted_count = sum(state['deleted'] for state in shards.values())
+        print(f"Total versions deleted: {deleted_count}")
+
+    if checkpoint_path and all(state['done'] for state in shards.values()):
+        os.remove(checkpoint_path)
+    return deleted_count
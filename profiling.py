@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+
+
+# upper bounds in seconds, the same buckets Prometheus clients use by default
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+_profiler = None
+
+
+def new_operation_stats():
+    return {'count': 0, 'errors': 0, 'retries': 0, 'bytes_sent': 0, 'bytes_received': 0,
+            'seconds': 0.0, 'max_seconds': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS)}
+
+
+def operation_key(event_name):
+    # 'after-call.s3.PutObject' -> ('s3', 'PutObject')
+    _, service, operation = event_name.split('.', 2)
+    return service, operation
+
+
+def header_int(headers, *names):
+    for name in names:
+        value = headers.get(name) or headers.get(name.lower())
+        if value:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                pass
+    return 0
+
+
+def request_size(request):
+    # aws-chunked uploads carry the payload size in a separate header
+    return header_int(request.headers, 'Content-Length', 'X-Amz-Decoded-Content-Length')
+
+
+def response_size(response_dict):
+    size = header_int(response_dict.get('headers', {}), 'Content-Length')
+    body = response_dict.get('body')
+    if not size and isinstance(body, bytes):
+        size = len(body)
+    return size
+
+
+class ApiProfiler:
+    # per (service, operation) counters fed by botocore events. Latency is
+    # the whole API call including retries; bytes come from Content-Length,
+    # so they are counted per attempt and do not wait for streamed bodies.
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, client):
+        events = client.meta.events
+        events.register('before-call', self.before_call)
+        events.register('before-send', self.before_send)
+        events.register('response-received', self.response_received)
+        events.register('after-call', self.after_call)
+        events.register('after-call-error', self.after_call_error)
+
+    def _stats(self, event_name):
+        key = operation_key(event_name)
+        if key not in self.stats:
+            self.stats[key] = new_operation_stats()
+        return self.stats[key]
+
+    def before_call(self, context, **kwargs):
+        context['profile_start'] = time.perf_counter()
+        context['profile_attempts'] = 0
+
+    def before_send(self, request, event_name, **kwargs):
+        with self._lock:
+            self._stats(event_name)['bytes_sent'] += request_size(request)
+
+    def response_received(self, context, response_dict, event_name, **kwargs):
+        context['profile_attempts'] = context.get('profile_attempts', 0) + 1
+        if response_dict:
+            with self._lock:
+                self._stats(event_name)['bytes_received'] += response_size(response_dict)
+
+    def after_call(self, context, http_response, event_name, **kwargs):
+        self._record(context, event_name, failed=http_response.status_code >= 300)
+
+    def after_call_error(self, context, event_name, **kwargs):
+        self._record(context, event_name, failed=True)
+
+    def _record(self, context, event_name, failed):
+        if 'profile_start' not in context:
+            return
+        elapsed = time.perf_counter() - context.pop('profile_start')
+        with self._lock:
+            stats = self._stats(event_name)
+            stats['count'] += 1
+            stats['errors'] += int(failed)
+            stats['retries'] += max(0, context.get('profile_attempts', 1) - 1)
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    stats['buckets'][index] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(stats, buckets=list(stats['buckets'])) for key, stats in self.stats.items()}
+
+    def to_json(self):
+        return json.dumps([
+            dict(service=service, operation=operation,
+                 p50_seconds=bucket_quantile(stats, 0.5), p99_seconds=bucket_quantile(stats, 0.99),
+                 buckets=dict(zip((str(bound) for bound in LATENCY_BUCKETS), stats['buckets'])),
+                 **{name: value for name, value in stats.items() if name != 'buckets'})
+            for (service, operation), stats in sorted(self.snapshot().items())
+        ], indent=2)
+
+    def to_prometheus(self):
+        lines = ['# TYPE aws_api_call_duration_seconds histogram']
+        counters = (('aws_api_call_errors_total', 'errors'), ('aws_api_call_retries_total', 'retries'),
+                    ('aws_api_bytes_sent_total', 'bytes_sent'),
+                    ('aws_api_bytes_received_total', 'bytes_received'))
+        snapshot = sorted(self.snapshot().items())
+        for (service, operation), stats in snapshot:
+            labels = f'service="{service}",operation="{operation}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'aws_api_call_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'aws_api_call_duration_seconds_sum{{{labels}}} {stats["seconds"]:.6f}')
+            lines.append(f'aws_api_call_duration_seconds_count{{{labels}}} {stats["count"]}')
+        for metric, name in counters:
+            lines.append(f'# TYPE {metric} counter')
+            for (service, operation), stats in snapshot:
+                lines.append(f'{metric}{{service="{service}",operation="{operation}"}} {stats[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def print_table(self):
+        snapshot = self.snapshot()
+        if not snapshot:
+            print("Profile: no AWS API calls were made")
+            return
+        print(f"{'service':<10} {'operation':<28} {'calls':>7} {'errors':>7} {'retries':>8} "
+              f"{'total s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'sent':>12} {'received':>12}")
+        # most expensive operations first
+        for (service, operation), stats in sorted(snapshot.items(), key=lambda item: -item[1]['seconds']):
+            print(f"{service:<10} {operation:<28} {stats['count']:>7} {stats['errors']:>7} "
+                  f"{stats['retries']:>8} {stats['seconds']:>9.3f} "
+                  f"{bucket_quantile(stats, 0.5) * 1000:>8.1f} {bucket_quantile(stats, 0.99) * 1000:>8.1f} "
+                  f"{stats['max_seconds'] * 1000:>8.1f} {stats['bytes_sent']:>12} {stats['bytes_received']:>12}")
+
+    def report(self, output_format='table', output_path=None):
+        if output_format == 'table':
+            self.print_table()
+            return
+        text = self.to_json() if output_format == 'json' else self.to_prometheus()
+        if output_path:
+            with open(output_path, 'w') as output_file:
+                output_file.write(text)
+            print(f"Profile written to {output_path}")
+        else:
+            print(text)
+
+
+def bucket_quantile(stats, fraction):
+    # upper bound of the histogram bucket holding the quantile; the open
+    # last bucket reports the largest latency seen instead of infinity
+    target = fraction * stats['count']
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+        seen += count
+        if count and seen >= target:
+            return min(bound, stats['max_seconds'])
+    return 0.0
+
+
+def enable_profiling():
+    # clients created by auth.init_client from now on are instrumented
+    global _profiler
+    if _profiler is None:
+        _profiler = ApiProfiler()
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def instrument_client(client):
+    if _profiler is not None:
+        _profiler.instrument(client)
+    return client